@@ -0,0 +1,117 @@
+import threading
+
+import numpy as np
+
+from SimulationHandler import SimulationHandler
+
+
+class BackgroundSolver:
+    # solves on its own copy of the field, the bot only ever reads the best solution so far
+
+    def __init__(self, layout_cache=None, search_workers=0, cache_path=None):
+        self.simulation = SimulationHandler(headless=True, verbose=False, search_workers=search_workers,
+                                            cache_path=cache_path, layout_cache=layout_cache)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.field = None
+        self.generation = 0
+        self.solution = None
+        self.player_id = None
+        self.trace = None
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, name="BackgroundSolver", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def same_shooter(field, other):
+        # same planets and own position, only opponents moved, joined or left
+        if other is None or field.own_id != other.own_id:
+            return False
+        own, other_own = field.position(field.own_id), other.position(other.own_id)
+        if own is None or other_own is None or not np.array_equal(own, other_own):
+            return False
+        return all(np.array_equal(a, b) for a, b in ((field.planet_pos, other.planet_pos),
+                                                     (field.planet_radius, other.planet_radius),
+                                                     (field.planet_mass, other.planet_mass)))
+
+    def restart(self, field):
+        # a new field cancels the running search. A new layout or own position drops the old solutions, when only
+        # opponents moved the last one stays and run() re-checks it
+        with self.lock:
+            self.generation += 1
+            if not self.same_shooter(field, self.field):
+                self.solution = None
+                self.player_id = None
+                self.trace = None
+            # a snapshot, the bot keeps updating its own field in place
+            self.field = field
+        self.wakeup.set()
+
+    def best(self):
+        with self.lock:
+            if self.solution is None:
+                return None
+            return self.solution.angle, self.solution.energy
+
+    def last_trace(self):
+        with self.lock:
+            return self.trace
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        self.thread.join(timeout=1)
+        self.simulation.close()
+
+    def _publish(self, generation, solution, player_id):
+        with self.lock:
+            if generation != self.generation:
+                return
+            # a hit beats any near miss, an exact miss beats a screened one, otherwise the closer shot wins
+            if self.solution is None or (solution.hit, solution.exact, -solution.distance) > \
+                    (self.solution.hit, self.solution.exact, -self.solution.distance):
+                self.solution = solution
+                self.player_id = player_id
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.running:
+                break
+
+            with self.lock:
+                generation = self.generation
+                field = self.field
+                kept = self.solution
+                kept_player_id = self.player_id
+
+            def cancelled():
+                return not self.running or generation != self.generation
+
+            self.simulation.load_field(field)
+            if kept is not None and kept.hit:
+                # only opponents moved since it was found, it stays while it still hits
+                if self.simulation.confirms_hit((kept.angle, kept.energy), kept_player_id):
+                    continue
+                with self.lock:
+                    if generation == self.generation:
+                        self.solution = None
+                        self.player_id = None
+                        self.trace = None
+
+            # the same cache, atlas, hit map and solver chain as find_solution, solver stages publish as they go
+            found = self.simulation.solve_shot(
+                on_progress=lambda solution, player_id: self._publish(generation, solution, player_id),
+                cancelled=cancelled)
+            if found is not None:
+                self._publish(generation, *found)
+
+            with self.lock:
+                solution = self.solution if generation == self.generation else None
+            if solution is not None:
+                trace = self.simulation.render_trace(solution.angle, solution.energy)
+                with self.lock:
+                    if generation == self.generation:
+                        self.trace = trace
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class Field:
+    # planets and players as contiguous arrays, the bot updates one in place from the network messages and hands
+    # snapshots to the simulation, its background solver and worker processes
+
+    def __init__(self, planet_data=None, player_pos=None, player_ids=None, own_id=None):
+        # planet_data rows are x, y, radius, mass like in msg_type 9, planet ids are the row numbers
+        self.set_planets(np.zeros((0, 4)) if planet_data is None else planet_data)
+
+        player_pos = np.zeros((0, 2)) if player_pos is None else np.asarray(player_pos, dtype=np.float64)
+        player_ids = np.zeros(0, dtype=np.int64) if player_ids is None else np.asarray(player_ids, dtype=np.int64)
+        # rows past player_count are spare capacity, joins don't reallocate every time
+        self._player_pos = np.array(player_pos, dtype=np.float64).reshape(-1, 2)
+        self._player_ids = np.array(player_ids, dtype=np.int64)
+        self.player_count = len(self._player_ids)
+        self.rows = {int(player_id): k for k, player_id in enumerate(self._player_ids)}
+        self.own_id = own_id
+
+    @classmethod
+    def from_objects(cls, planets, players, own_id):
+        planets = list(planets)
+        players = list(players)
+        planet_data = np.array([(*planet.position, planet.radius, planet.mass) for planet in planets],
+                               dtype=np.float64).reshape(-1, 4)
+        field = cls(planet_data, [player.position for player in players], [player.id for player in players], own_id)
+        field.planet_ids = np.array([planet.id for planet in planets], dtype=np.int64)
+        return field
+
+    @property
+    def player_pos(self):
+        return self._player_pos[:self.player_count]
+
+    @property
+    def player_ids(self):
+        return self._player_ids[:self.player_count]
+
+    def set_planets(self, planet_data):
+        planet_data = np.asarray(planet_data, dtype=np.float64).reshape(-1, 4)
+        self.planet_pos = planet_data[:, :2].copy()
+        self.planet_radius = planet_data[:, 2].copy()
+        self.planet_mass = planet_data[:, 3].copy()
+        self.planet_ids = np.arange(len(planet_data), dtype=np.int64)
+
+    def set_player(self, player_id, x, y):
+        # moves a known player in place, a new one goes last like it would in the server's list, True if new
+        row = self.rows.get(player_id)
+        if row is not None:
+            self._player_pos[row] = (x, y)
+            return False
+
+        if self.player_count == len(self._player_ids):
+            capacity = max(2 * self.player_count, 16)
+            self._player_pos = np.resize(self._player_pos, (capacity, 2))
+            self._player_ids = np.resize(self._player_ids, capacity)
+        row = self.player_count
+        self._player_pos[row] = (x, y)
+        self._player_ids[row] = player_id
+        self.rows[player_id] = row
+        self.player_count += 1
+        return True
+
+    def remove_player(self, player_id):
+        # later players move up a row, the order decides who gets hit first on shared cells
+        row = self.rows.pop(player_id, None)
+        if row is None:
+            return False
+        end = self.player_count
+        self._player_pos[row:end - 1] = self._player_pos[row + 1:end]
+        self._player_ids[row:end - 1] = self._player_ids[row + 1:end]
+        self.player_count -= 1
+        for k in range(row, self.player_count):
+            self.rows[int(self._player_ids[k])] = k
+        return True
+
+    def has_player(self, player_id):
+        return player_id in self.rows
+
+    def position(self, player_id):
+        row = self.rows.get(player_id)
+        return None if row is None else self._player_pos[row]
+
+    def snapshot(self):
+        # trimmed copies, nobody mutates a snapshot so threads can share it and it pickles small
+        snapshot = Field.__new__(Field)
+        snapshot.planet_pos = self.planet_pos.copy()
+        snapshot.planet_radius = self.planet_radius.copy()
+        snapshot.planet_mass = self.planet_mass.copy()
+        snapshot.planet_ids = self.planet_ids.copy()
+        snapshot._player_pos = self.player_pos.copy()
+        snapshot._player_ids = self.player_ids.copy()
+        snapshot.player_count = self.player_count
+        snapshot.rows = dict(self.rows)
+        snapshot.own_id = self.own_id
+        return snapshot
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class GravityField:
+    # summed planet acceleration sampled on a regular grid, interpolated bilinearly
+
+    def __init__(self, planet_pos, planet_radius, planet_mass, bounds, resolution=4.0, exact_margin=20.0):
+        self.planet_pos = planet_pos
+        self.planet_radius = planet_radius
+        self.planet_mass = planet_mass
+        self.resolution = resolution
+        self.exact_margin = exact_margin
+
+        self.min_x, self.min_y, max_x, max_y = bounds
+        self.nx = int(np.ceil((max_x - self.min_x) / resolution)) + 1
+        self.ny = int(np.ceil((max_y - self.min_y) / resolution)) + 1
+
+        xs = self.min_x + np.arange(self.nx) * resolution
+        ys = self.min_y + np.arange(self.ny) * resolution
+        gx, gy = np.meshgrid(xs, ys, indexing="ij")
+
+        self.ax = np.zeros((self.nx, self.ny))
+        self.ay = np.zeros((self.nx, self.ny))
+        # cells closer than exact_margin to a planet surface use the exact sum
+        self.near_cells = np.zeros((self.nx - 1, self.ny - 1), dtype=bool)
+        cx = xs[:-1, None] + resolution / 2
+        cy = ys[None, :-1] + resolution / 2
+        half_diagonal = resolution * np.sqrt(0.5)
+
+        for (x, y), radius, mass in zip(planet_pos, planet_radius, planet_mass):
+            dx = x - gx
+            dy = y - gy
+            # grid points inside planets only ever feed near cells, keep them finite
+            distance = np.maximum(np.sqrt(dx * dx + dy * dy), radius)
+            scale = mass / distance ** 3
+            self.ax += dx * scale
+            self.ay += dy * scale
+            self.near_cells |= np.hypot(x - cx, y - cy) <= radius + exact_margin + half_diagonal
+
+    def _cells(self, x, y):
+        fx = (x - self.min_x) / self.resolution
+        fy = (y - self.min_y) / self.resolution
+        i = np.clip(np.floor(fx).astype(np.int64), 0, self.nx - 2)
+        j = np.clip(np.floor(fy).astype(np.int64), 0, self.ny - 2)
+        return i, j, fx - i, fy - j
+
+    def near(self, x, y):
+        i, j, _, _ = self._cells(x, y)
+        return self.near_cells[i, j]
+
+    def sample(self, x, y):
+        # returns the exact-zone mask along with the interpolated acceleration
+        i, j, tx, ty = self._cells(x, y)
+        flat = i * self.ny + j
+        ax = self.ax.ravel()
+        ay = self.ay.ravel()
+        a00 = ax[flat]
+        a10 = ax[flat + self.ny]
+        a01 = ax[flat + 1]
+        a11 = ax[flat + self.ny + 1]
+        b00 = ay[flat]
+        b10 = ay[flat + self.ny]
+        b01 = ay[flat + 1]
+        b11 = ay[flat + self.ny + 1]
+        a0 = a00 + (a10 - a00) * tx
+        a1 = a01 + (a11 - a01) * tx
+        b0 = b00 + (b10 - b00) * tx
+        b1 = b01 + (b11 - b01) * tx
+        return self.near_cells[i, j], a0 + (a1 - a0) * ty, b0 + (b1 - b0) * ty
+
+    def exact(self, x, y):
+        dx = self.planet_pos[None, :, 0] - x[:, None]
+        dy = self.planet_pos[None, :, 1] - y[:, None]
+        distance = np.sqrt(dx * dx + dy * dy)
+        scale = self.planet_mass[None, :] / distance ** 3
+        return (dx * scale).sum(axis=1), (dy * scale).sum(axis=1)
+
+    def error_report(self, samples=20000, seed=0):
+        # compares the interpolated field against the exact sum on random points outside the exact zone
+        rng = np.random.default_rng(seed)
+        x = rng.uniform(self.min_x, self.min_x + (self.nx - 1) * self.resolution, samples)
+        y = rng.uniform(self.min_y, self.min_y + (self.ny - 1) * self.resolution, samples)
+        far = ~self.near(x, y)
+        x = x[far]
+        y = y[far]
+
+        _, ax, ay = self.sample(x, y)
+        ex, ey = self.exact(x, y)
+        error = np.hypot(ax - ex, ay - ey)
+        relative = error / np.maximum(np.hypot(ex, ey), 1e-12)
+
+        return {
+            "resolution": self.resolution,
+            "exact_margin": self.exact_margin,
+            "grid": (self.nx, self.ny),
+            "exact_fraction": float(self.near_cells.mean()),
+            "samples": int(len(x)),
+            "abs_mean": float(error.mean()) if len(x) else 0.0,
+            "abs_max": float(error.max()) if len(x) else 0.0,
+            "rel_mean": float(relative.mean()) if len(x) else 0.0,
+            "rel_p99": float(np.percentile(relative, 99)) if len(x) else 0.0,
+            "rel_max": float(relative.max()) if len(x) else 0.0,
+        }
@@ -0,0 +1,63 @@
+import numpy as np
+
+import utils
+
+
+class HitMap:
+    # result code and info of every cell of an angle x energy grid, angles wrap around, energies don't
+
+    def __init__(self, angles, energies, codes, infos):
+        self.angles = angles
+        self.energies = energies
+        self.codes = codes.reshape(len(angles), len(energies))
+        self.infos = infos.reshape(len(angles), len(energies))
+
+    def counts(self):
+        # cells per (result, info), e.g. (RES_HIT_PLAYER, 3) or (RES_HIT_PLANET, 12)
+        labels, counts = np.unique(np.stack([self.codes.ravel(), self.infos.ravel()], axis=1), axis=0,
+                                   return_counts=True)
+        return {(utils.MissileResult(int(code)), int(info)): int(count) for (code, info), count in zip(labels, counts)}
+
+    def targets(self):
+        hits = self.codes == utils.MissileResult.RES_HIT_PLAYER.value
+        return [int(player_id) for player_id in np.unique(self.infos[hits])]
+
+    def mask(self, player_id):
+        return (self.codes == utils.MissileResult.RES_HIT_PLAYER.value) & (self.infos == player_id)
+
+    @staticmethod
+    def depth(mask):
+        # erosions a cell survives, i.e. how many grid steps of aiming error it tolerates in every direction
+        depth = np.zeros(mask.shape, dtype=np.int64)
+        current = mask.copy()
+        while current.any():
+            depth += current
+            eroded = current & np.roll(current, 1, axis=0) & np.roll(current, -1, axis=0)
+            eroded[:, 1:] &= current[:, :-1]
+            eroded[:, :-1] &= current[:, 1:]
+            # the energy range ends at the grid border
+            eroded[:, 0] = False
+            eroded[:, -1] = False
+            current = eroded
+        return depth
+
+    def widest(self, player_id):
+        # (depth, angle, energy) of the cell deepest inside the player's hit region, None if it is never hit
+        depth = self.depth(self.mask(player_id))
+        deepest = depth.max()
+        if not deepest:
+            return None
+        cells = np.argwhere(depth == deepest)
+        i, j = cells[len(cells) // 2]
+        return int(deepest), float(self.angles[i]), float(self.energies[j])
+
+    def ranked(self, exclude=()):
+        # every hit player as (player id, depth, angle, energy), most error tolerant first, larger region on ties
+        ranked = []
+        for player_id in self.targets():
+            if player_id in exclude:
+                continue
+            depth, angle, energy = self.widest(player_id)
+            ranked.append((depth, int(self.mask(player_id).sum()), player_id, angle, energy))
+        ranked.sort(key=lambda entry: (-entry[0], -entry[1]))
+        return [(player_id, depth, angle, energy) for depth, _, player_id, angle, energy in ranked]
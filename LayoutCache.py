@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+
+class LayoutCache:
+    # planet-layout derived data shared by every SimulationHandler of a process, bots on one server see the same
+    # planets so the gravity field table and planet cells get built once instead of once per bot
+
+    def __init__(self, max_layouts=4):
+        self.max_layouts = max_layouts
+        self.entries = OrderedDict()
+        # the lock only covers lookups and inserts, a build holds the lock of its (layout, name) so a second bot
+        # asking for the same table waits for it while other tables and layouts go ahead
+        self.lock = threading.Lock()
+        self.building = {}
+
+        self.hits = 0
+        self.builds = 0
+
+    def lookup(self, key, name):
+        # under self.lock, marks the layout as recently used
+        entry = self.entries.get(key)
+        if entry is None or name not in entry:
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[name]
+
+    def get(self, key, name, build):
+        with self.lock:
+            found, value = self.lookup(key, name)
+            if found:
+                return value
+            building = self.building.setdefault((key, name), threading.Lock())
+
+        with building:
+            with self.lock:
+                found, value = self.lookup(key, name)
+                if found:
+                    return value
+            try:
+                value = build()
+            finally:
+                with self.lock:
+                    self.building.pop((key, name), None)
+
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = {}
+                    while len(self.entries) > self.max_layouts:
+                        self.entries.popitem(last=False)
+                self.entries.move_to_end(key)
+                entry[name] = value
+                self.builds += 1
+            return value
+
+    def stats(self):
+        with self.lock:
+            return {"layouts": len(self.entries), "hits": self.hits, "builds": self.builds}
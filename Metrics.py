@@ -0,0 +1,154 @@
+import bisect
+import threading
+import time
+
+# latency buckets in seconds, the last one catches everything
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the quantile, good enough for a summary line
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    # counters and per-phase latency histograms, every call returns right away while disabled
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.summary_interval = 0
+        self.path = None
+        self.server = None
+        self.last_summary = time.monotonic()
+        self.last_counters = {}
+
+    def configure(self, enabled=True, summary_interval=60, path=None, port=None):
+        # path gets the prometheus text on every summary, port serves it on 127.0.0.1/metrics
+        self.enabled = enabled
+        self.summary_interval = summary_interval
+        self.path = path
+        self.last_summary = time.monotonic()
+        if enabled and port and self.server is None:
+            # http.server only loads when it serves, it costs more to import than the rest of this module
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+            threading.Thread(target=self.server.serve_forever, name="Metrics", daemon=True).start()
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def count(self, name, value=1, labels=()):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, phase, start, labels=()):
+        # start comes from now(), labels is a tuple of (name, value) pairs
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - start
+        key = (phase, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(elapsed)
+
+    def tick(self):
+        # called from the bot loop, prints and writes the summary once per interval
+        if not self.enabled or not self.summary_interval:
+            return
+        now = time.monotonic()
+        if now - self.last_summary < self.summary_interval:
+            return
+        print(self.summary(now - self.last_summary))
+        self.last_summary = now
+        if self.path:
+            with open(self.path, "w") as f:
+                f.write(self.prometheus())
+
+    def summary(self, interval):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = [(key, h.count, h.total, h.quantile(0.5), h.quantile(0.95))
+                          for key, h in sorted(self.histograms.items())]
+        lines = [f"metrics, rates over the last {interval:.0f} s, latencies since start"]
+        for key in (("simulations", ()), ("segments", ()), ("solution_cache_hits", ()), ("solution_cache_misses", ())):
+            delta = counters.get(key, 0) - self.last_counters.get(key, 0)
+            lines.append(f"  {key[0]:28} {delta / interval:12.1f}/s")
+        for (phase, labels), count, total, p50, p95 in histograms:
+            name = phase + "".join(f" {k}={v}" for k, v in labels)
+            lines.append(f"  {name:28} {count:8} calls  mean {total / count * 1000:8.2f} ms  "
+                         f"p50 <{p50 * 1000:g} ms  p95 <{p95 * 1000:g} ms")
+        self.last_counters = counters
+        return "\n".join(lines)
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"applebot_{name}_total{format_labels(labels)} {value}")
+            for (phase, labels), histogram in sorted(self.histograms.items()):
+                labels = (("phase", phase),) + labels
+                seen = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    seen += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"applebot_phase_seconds_bucket{format_labels(labels + (('le', le),))} {seen}")
+                lines.append(f"applebot_phase_seconds_sum{format_labels(labels)} {histogram.total}")
+                lines.append(f"applebot_phase_seconds_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# one registry per process, the bot, its simulation and the background solver all report here
+metrics = Metrics()
@@ -0,0 +1,197 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+
+import numpy as np
+
+import utils
+
+
+def _worker(tasks, results, epoch):
+    # imported here so the parent can import this module from SimulationHandler
+    from SimulationHandler import SimulationHandler
+
+    # set_field logs the whole layout, once from the parent is enough
+    sys.stdout = open(os.devnull, "w")
+    simulation = SimulationHandler(headless=True)
+    version = None
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        if task[0] == "field":
+            _, version, field = task
+            simulation.load_field(field)
+
+        elif task[0] == "search":
+            _, task_id, task_version, task_epoch, angles, energies, approximate = task
+            if task_version != version:
+                results.put((task_id, None, 0))
+                continue
+            codes, infos, lengths, _, _ = simulation.simulate_batch(
+                angles, energies, trace=False, approximate=approximate, early_exit=simulation.earlyExit,
+                checkpoint=lambda *_: epoch.value != task_epoch)
+            results.put((task_id, simulation.best_hit(angles, energies, codes, infos, lengths), len(angles)))
+
+        elif task[0] == "evaluate":
+            # ShotSolver batches, codes, infos and closest distances go back as they are
+            _, task_id, task_version, task_epoch, angles, energies, (target, approximate, adaptive, early_exit) = task
+            if task_version != version:
+                results.put((task_id, None, 0))
+                continue
+            def checkpoint(codes, infos, closest, task_id=task_id, task_epoch=task_epoch):
+                # progress goes back without a simulation count, a cancelled search bumps the epoch
+                results.put((task_id, (codes.copy(), infos.copy(), closest.copy()), None))
+                return epoch.value != task_epoch
+
+            codes, infos, _, _, closest = simulation.simulate_batch(
+                angles, energies, trace=False, approximate=approximate, target=target, adaptive=adaptive,
+                early_exit=early_exit, checkpoint=checkpoint)
+            results.put((task_id, (codes, infos, closest), len(angles)))
+
+
+class ParallelSearch:
+    # pool of worker processes, each holding its own copy of the field
+
+    def __init__(self, workers=None, poll_timeout=0.25):
+        self.workers = workers or os.cpu_count() or 1
+        # how long a search waits on the results queue before it checks that every worker is still alive and
+        # hands its progress to the checkpoint
+        self.poll_timeout = poll_timeout
+        # a dead worker never answers, from then on callers search locally
+        self.broken = False
+        self.version = 0
+        self.task_ids = itertools.count()
+        # spawned, not forked, the parent may already run the visualizer's SDL thread
+        context = multiprocessing.get_context("spawn")
+        # bumped when a search is abandoned, workers stop its batches at their next checkpoint
+        self.epoch = context.Value("i", 0)
+        self.results = context.Queue()
+        self.queues = []
+        self.processes = []
+
+        for _ in range(self.workers):
+            tasks = context.Queue()
+            process = context.Process(target=_worker, args=(tasks, self.results, self.epoch), daemon=True)
+            process.start()
+            self.queues.append(tasks)
+            self.processes.append(process)
+
+    def set_field(self, field):
+        # the field snapshot goes out once per worker here, search tasks only carry angles and energies
+        self.version += 1
+        for tasks in self.queues:
+            tasks.put(("field", self.version, field))
+
+    def alive(self):
+        if not self.broken and not all(process.is_alive() for process in self.processes):
+            print("search worker died, searching in-process from now on")
+            self.broken = True
+        return not self.broken
+
+    def _run(self, kind, angles, energies, options, checkpoint=None):
+        # {(begin, end): (payload, simulations)} per contiguous block, None if a worker died on the way.
+        # checkpoint(answers) runs whenever an answer arrives or the poll times out, True abandons the search
+        # and returns the answers so far, blocks still running then have their last progress and no count
+        if not self.alive():
+            return None
+
+        # one contiguous block per worker, a batch costs per step more than per shot so small slices don't pay
+        pending = {}
+        epoch = self.epoch.value
+        bounds = np.linspace(0, len(angles), min(self.workers, len(angles)) + 1).astype(np.int64)
+        for tasks, begin, end in zip(self.queues, bounds[:-1], bounds[1:]):
+            task_id = next(self.task_ids)
+            pending[task_id] = (begin, end)
+            tasks.put((kind, task_id, self.version, epoch, angles[begin:end].copy(), energies[begin:end].copy(),
+                       options))
+
+        answers = {}
+        while pending:
+            try:
+                task_id, payload, count = self.results.get(timeout=self.poll_timeout)
+            except queue.Empty:
+                if not self.alive():
+                    return None
+            else:
+                if task_id not in pending:
+                    # leftover of an earlier, abandoned search
+                    continue
+                if count is None:
+                    # progress of a block that is still running
+                    answers[pending[task_id]] = (payload, None)
+                else:
+                    answers[pending.pop(task_id)] = (payload, count)
+            if pending and checkpoint is not None and checkpoint(answers):
+                with self.epoch.get_lock():
+                    self.epoch.value += 1
+                break
+        return answers
+
+    def search(self, angles, energies, approximate=False):
+        # (best hit, simulations), None if the pool can't answer and the caller has to search itself
+        angles, energies = np.broadcast_arrays(np.asarray(angles, dtype=np.float64).ravel(),
+                                               np.asarray(energies, dtype=np.float64).ravel())
+        answers = self._run("search", angles, energies, approximate)
+        if answers is None:
+            return None
+
+        best = None
+        simulated = 0
+        for hit, count in answers.values():
+            simulated += count
+            if hit is not None and (best is None or hit[3] < best[3]):
+                best = hit
+        return best, simulated
+
+    def evaluate(self, angles, energies, target, approximate=False, adaptive=False, early_exit=False,
+                 checkpoint=None):
+        # simulate_batch's codes, infos and closest, None if the pool can't answer or still has an older field.
+        # checkpoint(codes, infos, closest) sees the blocks answered so far like simulate_batch's, True stops
+        angles, energies = np.broadcast_arrays(np.asarray(angles, dtype=np.float64).ravel(),
+                                               np.asarray(energies, dtype=np.float64).ravel())
+        codes = np.full(len(angles), utils.MissileResult.RES_UNDETERMINED.value, dtype=np.int64)
+        infos = np.zeros(len(angles), dtype=np.int64)
+        closest = np.full(len(angles), np.inf)
+        collected = set()
+        stale = []
+
+        def collect(answers):
+            for (begin, end), (payload, count) in answers.items():
+                if begin in collected:
+                    continue
+                if count is not None:
+                    collected.add(begin)
+                if payload is None:
+                    stale.append(begin)
+                else:
+                    codes[begin:end], infos[begin:end], closest[begin:end] = payload
+
+        block_checkpoint = None
+        if checkpoint is not None:
+            def block_checkpoint(answers):
+                collect(answers)
+                return bool(stale) or checkpoint(codes, infos, closest)
+
+        answers = self._run("evaluate", angles, energies, (target, approximate, adaptive, early_exit),
+                            block_checkpoint)
+        if answers is None:
+            return None
+        collect(answers)
+        if stale:
+            return None
+        return codes, infos, closest
+
+    def close(self):
+        for tasks in self.queues:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.queues = []
+        self.processes = []
@@ -0,0 +1,145 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+
+class Profiler:
+    # profiles a running bot for a bounded window: a sampling thread collapses the stacks of every thread into
+    # <prefix>.collapsed (flamegraph.pl, speedscope) and every thread calling step() runs cProfile for the window
+    # and dumps <prefix>-<thread name>.pstats. Off, step() is one attribute check
+
+    def __init__(self):
+        self.active = False
+        self.lock = threading.Lock()
+        self.profiles = {}
+        self.seconds = 10.0
+        self.interval = 0.005
+        self.directory = "."
+        self.prefix = None
+        self.server = None
+        # cProfile.Profile once start() has imported it, a bot that never profiles doesn't load it
+        self.new_profile = None
+
+    def configure(self, seconds=10.0, interval=0.005, directory=".", signum=None, port=None):
+        # signum (e.g. signal.SIGUSR1) has to be installed from the main thread, port serves 127.0.0.1/profile
+        self.seconds = seconds
+        self.interval = interval
+        self.directory = directory
+        if signum is not None:
+            # the handler may interrupt step() holding the lock, start from another thread
+            signal.signal(signum, lambda *_: threading.Thread(target=self.start, name="Profiler").start())
+        if port and self.server is None:
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+            threading.Thread(target=self.server.serve_forever, name="Profiler", daemon=True).start()
+
+    def start(self, seconds=None):
+        # returns the output prefix, None while a window is still running
+        with self.lock:
+            if self.active:
+                return None
+            import cProfile
+            self.new_profile = cProfile.Profile
+            self.active = True
+            self.prefix = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S"))
+        seconds = self.seconds if seconds is None else seconds
+        threading.Thread(target=self.sample, args=(seconds, self.prefix), name="Sampler", daemon=True).start()
+        print(f"profiling for {seconds:g} s into {self.prefix}")
+        return self.prefix
+
+    def step(self):
+        # called from AppleBot.loop and ShotSolver.solve, starts or stops cProfile on the calling thread
+        if not self.active and not self.profiles:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            entry = self.profiles.get(thread.ident)
+            if self.active and entry is None:
+                profile = self.new_profile()
+                self.profiles[thread.ident] = (profile, self.prefix)
+                start = True
+            elif not self.active and entry is not None:
+                profile, prefix = self.profiles.pop(thread.ident)
+                start = False
+            else:
+                return
+
+        if start:
+            try:
+                profile.enable()
+            except ValueError:
+                # only one profiler may run at a time on newer interpreters, the samples still cover this thread
+                pass
+            return
+        profile.disable()
+        path = f"{prefix}-{thread.name}.pstats"
+        try:
+            profile.dump_stats(path)
+        except (TypeError, OSError) as e:
+            print(f"profile for {thread.name} not written: {e}")
+            return
+        print(f"profile written to {path}")
+
+    def sample(self, seconds, prefix):
+        stacks = {}
+        names = {}
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            time.sleep(self.interval)
+
+        # threads dump their pstats on their next step()
+        self.active = False
+        path = f"{prefix}.collapsed"
+        with open(path, "w") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"{sum(stacks.values())} samples written to {path}")
+
+    def handler(self):
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qs, urlparse
+        profiler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/profile":
+                    self.send_error(404)
+                    return
+                try:
+                    seconds = float(parse_qs(url.query).get("seconds", [profiler.seconds])[0])
+                except ValueError:
+                    self.send_error(400)
+                    return
+                prefix = profiler.start(seconds)
+                body = (f"profiling into {prefix}\n" if prefix else "already profiling\n").encode("UTF-8")
+                self.send_response(200 if prefix else 409)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# one per process like metrics, the bot loop and every solver thread step it
+profiler = Profiler()
@@ -0,0 +1,57 @@
+import struct
+import time
+
+MAGIC = b"ABCAP1\n"
+# per record: direction, seconds since the capture started, byte count, then the bytes
+RECORD = struct.Struct("<BdI")
+INBOUND = 0
+OUTBOUND = 1
+
+
+class SessionCapture:
+    # raw bytes of one connection in both directions with monotonic timestamps, replay.py feeds them back
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.start = time.monotonic()
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, direction, data):
+        if self.file is None:
+            return
+        self.file.write(RECORD.pack(direction, time.monotonic() - self.start, len(data)))
+        self.file.write(data)
+        self.records += 1
+        self.bytes += len(data)
+
+    def inbound(self, data):
+        self.write(INBOUND, data)
+
+    def outbound(self, data):
+        self.write(OUTBOUND, data)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        print(f"capture: {self.records} records, {self.bytes} bytes written to {self.path}")
+
+
+def read_capture(path):
+    # yields (direction, seconds, bytes) in recorded order, a record cut off by a crash ends the capture
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session capture")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            direction, seconds, byte_count = RECORD.unpack(header)
+            data = f.read(byte_count)
+            if len(data) < byte_count:
+                return
+            yield direction, seconds, data
@@ -0,0 +1,77 @@
+import numpy as np
+
+import utils
+
+
+class ShotAtlas:
+    # fan of own shots through the planet field, opponents ignored, indexed by trace point
+
+    def __init__(self, simulation, angle_step=0.5, energies=(8, 10, 12, 14), decimation=4):
+        # scipy is only needed once an atlas gets built
+        from scipy.spatial import cKDTree
+
+        self.simulation = simulation
+        angles, energies = np.meshgrid(np.arange(0, 360, angle_step), np.asarray(energies, dtype=np.float64),
+                                       indexing="ij")
+        self.angles = angles.ravel()
+        self.energies = energies.ravel()
+        self.angle_step = angle_step
+
+        # the fan only proposes candidates, every answer is confirmed exactly, so the field table is fine here
+        results = simulation.simulate_shots(self.angles, self.energies, approximate=True, ignore_players=True)
+
+        points = []
+        shot_ids = []
+        segments = []
+        for k, (_, _, trace) in enumerate(results):
+            if not len(trace):
+                continue
+            trace = trace[::decimation]
+            points.append(trace.astype(np.float32))
+            shot_ids.append(np.full(len(trace), k, dtype=np.int32))
+            segments.append(np.arange(len(trace), dtype=np.int32) * decimation)
+
+        self.decimation = decimation
+        self.points = np.concatenate(points) if points else np.zeros((0, 2), dtype=np.float32)
+        self.shot_ids = np.concatenate(shot_ids) if shot_ids else np.zeros(0, dtype=np.int32)
+        self.segments = np.concatenate(segments) if segments else np.zeros(0, dtype=np.int32)
+        self.tree = cKDTree(self.points) if len(self.points) else None
+
+    def candidates(self, target, count=8):
+        # shots ordered by how close their trace passes to target, with the segment they get there
+        if self.tree is None:
+            return []
+        k = min(len(self.points), count * 64)
+        _, points = self.tree.query(target, k=k)
+        shots = {}
+        for point in np.atleast_1d(points):
+            shot = int(self.shot_ids[point])
+            if shot not in shots:
+                shots[shot] = int(self.segments[point])
+                if len(shots) == count:
+                    break
+        return [(float(self.angles[shot]), float(self.energies[shot]), segment) for shot, segment in shots.items()]
+
+    def aim(self, target, player_id, checks=4, refine=16):
+        candidates = self.candidates(target)
+        if not candidates:
+            return None
+
+        # exact check of the closest few, each only simulated up to where it passes the target
+        for angle, energy, segment in candidates[:checks]:
+            res, info, _ = self.simulation.simulate_own_shot(angle, energy, max_segments=segment + 2 * self.decimation,
+                                                             trace=False)
+            if res == utils.MissileResult.RES_HIT_PLAYER and info == player_id:
+                return angle, energy
+
+        # nearest fan shot just missed, sweep the gap to its neighbours in one batch
+        angle, energy, segment = candidates[0]
+        angles = angle + np.linspace(-self.angle_step, self.angle_step, 2 * refine + 1)
+        codes, infos, lengths, _, _ = self.simulation.simulate_batch(angles % 360, energy, trace=False,
+                                                                  max_segments=2 * segment + 4 * self.decimation)
+        hits = np.flatnonzero((codes == utils.MissileResult.RES_HIT_PLAYER.value) & (infos == player_id))
+        if not len(hits):
+            return None
+        # middle of the hit window tolerates the most aiming error
+        k = hits[len(hits) // 2]
+        return float(angles[k] % 360), energy
@@ -0,0 +1,158 @@
+import numpy as np
+
+import utils
+from Metrics import metrics
+from Profiler import profiler
+
+
+class ShotSolver:
+    # coarse angle x energy grid, then shrinking local grids around the closest few cells
+
+    def __init__(self, simulation, angle_step=2.0, energy_steps=6, beam=4, refine=5,
+                 max_simulations=6000, angle_tolerance=0.001, energy_tolerance=0.001, approximate_coarse=True,
+                 adaptive_coarse=False):
+        self.simulation = simulation
+        self.angle_step = angle_step
+        self.energy_steps = energy_steps
+        self.beam = beam
+        self.refine = refine
+        self.max_simulations = max_simulations
+        self.angle_tolerance = angle_tolerance
+        self.energy_tolerance = energy_tolerance
+        self.approximate_coarse = approximate_coarse
+        # adaptive steps for the coarse grid instead of the field table, the beam is re-checked exactly either way
+        self.adaptive_coarse = adaptive_coarse
+
+    def _evaluate(self, angles, energies, target, player_id, approximate=False, adaptive=False, checkpoint=None,
+                  in_process=False):
+        # screening may stop hopeless shots early too, their distance only has to rank them out of the beam
+        early_exit = (approximate or adaptive) and self.simulation.earlyExit
+        # split across the worker pool when there is one, in-process if it can't answer
+        result = None
+        if self.simulation.search_pool is not None and not in_process:
+            result = self.simulation.search_pool.evaluate(angles, energies, target, approximate, adaptive, early_exit,
+                                                          checkpoint)
+        if result is None:
+            codes, infos, _, _, closest = self.simulation.simulate_batch(angles, energies, trace=False,
+                                                                         approximate=approximate, target=target,
+                                                                         adaptive=adaptive, early_exit=early_exit,
+                                                                         checkpoint=checkpoint)
+        else:
+            codes, infos, closest = result
+        hit = (codes == utils.MissileResult.RES_HIT_PLAYER.value) & (infos == player_id)
+        return np.where(hit, 0.0, closest)
+
+    def solve(self, target, player_id, on_progress=None, cancelled=None):
+        # on_progress gets the best Solution so far, screened ones (exact False) from the coarse batch, exact ones
+        # after every later stage, cancelled() ends the search early
+        profiler.step()
+        start = metrics.now()
+        min_energy = self.simulation.minEnergy
+        max_energy = self.simulation.maxEnergy
+        target = np.asarray(target, dtype=np.float64)
+
+        angles, energies = np.meshgrid(np.arange(0, 360, self.angle_step),
+                                       np.linspace(min_energy, max_energy, self.energy_steps), indexing="ij")
+        angles = angles.ravel()
+        energies = energies.ravel()
+        screening = self.approximate_coarse or self.adaptive_coarse
+
+        checkpoint = None
+        if cancelled is not None:
+            # checked inside the batches too, a restart doesn't wait for a whole stage
+            def checkpoint(codes, infos, closest):
+                return cancelled()
+
+        # the coarse batch publishes its best candidate at every checkpoint, a hit confirmed on the way ends it
+        confirmed = []
+        checked = np.zeros(len(angles), dtype=bool)
+        rechecked = np.zeros(len(angles))
+
+        def coarse_checkpoint(codes, infos, closest):
+            if cancelled is not None and cancelled():
+                return True
+            hit = (codes == utils.MissileResult.RES_HIT_PLAYER.value) & (infos == player_id)
+            hits = np.flatnonzero(hit & ~checked)[:self.beam]
+            if len(hits) and screening:
+                checked[hits] = True
+                # in-process, the pool is busy with the coarse batch this checkpoint belongs to
+                rechecked[hits] = self._evaluate(angles[hits], energies[hits], target, player_id,
+                                                 checkpoint=checkpoint, in_process=True)
+                hits = hits[rechecked[hits] == 0.0]
+            if len(hits):
+                confirmed.append(hits[0])
+                return True
+            candidates = np.where(hit, 0.0, closest)
+            # nothing to publish before the first shot got anywhere, or a worker answered
+            if on_progress is not None and np.isfinite(candidates).any():
+                on_progress(self._solution(angles, energies, candidates, np.argmin(candidates), len(angles),
+                                           not screening))
+            return False
+
+        distances = self._evaluate(angles, energies, target, player_id, self.approximate_coarse, self.adaptive_coarse,
+                                   coarse_checkpoint)
+        simulations = len(angles) + int(checked.sum())
+        distances = np.where(checked, rechecked, distances)
+        if confirmed:
+            solution = self._solution(angles, energies, distances, confirmed[0], simulations)
+            if on_progress is not None:
+                on_progress(solution)
+            metrics.observe("solve", start)
+            return solution
+        if cancelled is not None and cancelled():
+            metrics.observe("solve", start)
+            return self._solution(angles, energies, distances, np.argmin(distances), simulations, not screening)
+
+        if screening:
+            # only exact distances go into the refinement and the answer
+            order = np.argsort(distances, kind="stable")[:self.beam]
+            angles = angles[order]
+            energies = energies[order]
+            distances = self._evaluate(angles, energies, target, player_id, checkpoint=checkpoint)
+            simulations += len(order)
+
+        angle_step = self.angle_step
+        energy_step = (max_energy - min_energy) / max(self.energy_steps - 1, 1)
+        offsets = np.linspace(-0.5, 0.5, self.refine)
+
+        while True:
+            # long solves on the background thread start and stop profiling windows between stages too
+            profiler.step()
+            order = np.argsort(distances, kind="stable")[:self.beam]
+            best = order[0]
+            if on_progress is not None:
+                on_progress(self._solution(angles, energies, distances, best, simulations))
+            if cancelled is not None and cancelled():
+                break
+            if distances[best] == 0.0:
+                break
+            if angle_step < self.angle_tolerance and energy_step < self.energy_tolerance:
+                break
+            cost = len(order) * self.refine * self.refine
+            if simulations + cost > self.max_simulations:
+                break
+
+            # local grid spanning one parent cell around each of the best candidates
+            local_angles = (angles[order, None, None] + offsets[None, :, None] * angle_step) % 360
+            local_energies = np.clip(energies[order, None, None] + offsets[None, None, :] * energy_step,
+                                     min_energy, max_energy)
+            local_angles, local_energies = np.broadcast_arrays(local_angles, local_energies)
+            local_angles = local_angles.ravel()
+            local_energies = local_energies.ravel()
+            local_distances = self._evaluate(local_angles, local_energies, target, player_id, checkpoint=checkpoint)
+            simulations += len(local_angles)
+
+            angles = np.concatenate([angles[order], local_angles])
+            energies = np.concatenate([energies[order], local_energies])
+            distances = np.concatenate([distances[order], local_distances])
+            angle_step *= offsets[1] - offsets[0]
+            energy_step *= offsets[1] - offsets[0]
+
+        metrics.observe("solve", start)
+        return self._solution(angles, energies, distances, np.argmin(distances), simulations)
+
+    @staticmethod
+    def _solution(angles, energies, distances, best, simulations, exact=True):
+        # a screened hit is no hit until an exact run confirms it
+        return utils.Solution(float(angles[best]), float(energies[best]), float(distances[best]),
+                              exact and bool(distances[best] == 0.0), simulations, exact)
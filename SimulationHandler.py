@@ -1,49 +1,71 @@
 import math
-import random
+import time
 
 import numpy as np
-from tqdm import tqdm
-
-import pygame
-from pygame.locals import *
 
 import utils
-import colorsys
-from datetime import datetime
-
-from scipy import optimize
-from scipy.spatial.distance import cdist
-
-vertCircle = np.zeros((32, 2))
-
-for i in range(8):
-    a = 2 * math.pi / 32 + 2 * math.pi / 16 * i
-    x = math.sin(a)
-    y = math.cos(a)
-    vertCircle[i][0] = x
-    vertCircle[i][1] = y
-    vertCircle[8 + i][0] = -x
-    vertCircle[8 + i][1] = -y
-    vertCircle[16 + 2 * i][0] = x
-    vertCircle[16 + 2 * i][1] = y
-    vertCircle[16 + 2 * i + 1][0] = -x
-    vertCircle[16 + 2 * i + 1][1] = -y
+from GravityField import GravityField
+from SpatialIndex import SpatialIndex
+from ParallelSearch import ParallelSearch
+from SolutionCache import SolutionCache
+from ShotAtlas import ShotAtlas
+from HitMap import HitMap
+from Field import Field
+from ShotSolver import ShotSolver
+from Metrics import metrics
 
 
 class SimulationHandler:
 
-    def __init__(self):
+    def __init__(self, headless=False, search_workers=0, cache_size=256, cache_path=None, verbose=True,
+                 visualizer_fps=30, layout_cache=None):
         self.A = 2e6
         self.battlefieldW = math.sqrt(self.A * 16 / 9)
         self.battlefieldH = math.sqrt(self.A * 9 / 16)
         self.playerSize = 4.0 * 0.8
         self.margin = 500
-        self.players = None
-        self.planets = None
+        self.field = None
         self.maxSegments = 4000
         self.segmentSteps = 25
         self.maxPlayers = 12
         self.numPlanets = 24
+        self.gravityFieldResolution = 4.0
+        self.gravityFieldExactMargin = 20.0
+        # adaptive mode: a step may cover up to adaptiveMaxStride substeps, moving at most adaptiveClearance of
+        # the gap to the nearest planet surface and changing the speed by at most adaptiveVelocityChange
+        self.adaptiveMaxStride = 8
+        self.adaptiveClearance = 0.25
+        self.adaptiveVelocityChange = 0.01
+        # search paths stop hopeless shots early, checked every earlyExitInterval substeps: RES_ESCAPED when the
+        # missile moves away from every planet and player with more than earlyExitEscapeSlack of its kinetic energy
+        # left over escape, or earlyExitBoundsSlack times what crossing the margin against the summed planet pull takes,
+        # RES_UNREACHABLE when its energy is more than earlyExitReachSlack (relative) below the potential at every
+        # opponent, energy is conserved up to small integration drift so it never gets there. A shot that would only
+        # come back around to hit ourselves counts as hopeless too
+        self.earlyExit = True
+        self.earlyExitInterval = 25
+        self.earlyExitEscapeSlack = 0.5
+        self.earlyExitBoundsSlack = 2.0
+        self.earlyExitReachSlack = 0.05
+        # simulate_batch hands its progress to a checkpoint every checkpointInterval steps, True stops the batch
+        self.checkpointInterval = 250
+        self.gravity_field = None
+        self.gravity_field_key = None
+        self.indexCellSize = 64
+        self.index = None
+        self.useShotAtlas = False
+        # one sweep labelling what every angle x energy cell hits, find_solution then takes the widest hit region
+        self.useHitMap = False
+        self.hitMapAngleStep = 1.0
+        self.hitMapEnergySteps = 6
+        self.hitMapAdaptive = True
+        self.hit_map = None
+        self.hit_map_key = None
+        self.atlas = None
+        self.atlas_key = None
+        # shared with the other bots of the process, see LayoutCache, layout_key is the planet digest
+        self.layout_cache = layout_cache
+        self.layout_key = None
 
         self.own_id = None
         self.position = None
@@ -53,40 +75,115 @@ class SimulationHandler:
         self.battlefieldH = 1060
 
         self.maxPower = 50
-        self.dragging = False
+        self.minEnergy = 5.0
+        self.maxEnergy = 15.0
+        self.solver = ShotSolver(self)
         self.power = 0
         self.angle = 0
 
+        # world coordinates, the visualizer maps them to the screen
         self.lastTrace = []
-        self.lastTraceTime = datetime.now()
-        self.traceUpdateDelay = 500
-
-        pygame.init()
-        self.display = (1120, 630)
-        self.surface = pygame.display.set_mode(self.display)
-        pygame.display.set_caption("AppleBot")
-        self.reshape(self.display[0], self.display[1])
+        # every k-th point in float32 is plenty for drawing a trace
+        self.renderTraceDecimation = 4
+        # simulate_own_shot writes its trace here, copies go out only when a caller asks for the trace
+        self.trace_buffer = np.empty((self.maxSegments, 2))
+
+        # worker processes for search_shot, they get the layout once per set_field
+        self.search_pool = ParallelSearch(search_workers) if search_workers else None
+        self.solution_cache = SolutionCache(cache_size, cache_path)
+
+        self.headless = headless
+        self.verbose = verbose
+        self.visualizer = None
+        if not headless:
+            # pygame is only loaded with a window, fps 0 draws inline on the calling thread
+            from Visualizer import Visualizer
+            self.visualizer = Visualizer(self.battlefieldW, self.battlefieldH, self.playerSize, self.maxPlayers,
+                                         self.maxPower, visualizer_fps, threaded=visualizer_fps > 0)
+
+    def close(self):
+        # on shutdown, the cache file is only complete once closed
+        if self.verbose and (self.solution_cache.hits or self.solution_cache.misses):
+            print(f"solution cache: {self.solution_cache.stats()}")
+        self.solution_cache.close()
+        if self.search_pool is not None:
+            self.search_pool.close()
 
     def set_field(self, planets, players, own_id):
-        self.initialized = True
-        self.players = players
-        self.planets = planets
-        self.own_id = own_id
-        print(self.players)
-        print(self.planets)
-
-        for planet in planets:
-            print(planet)
+        self.load_field(Field.from_objects(planets, players, own_id))
 
-        for player in players:
-            print(player)
-            if player.id == own_id:
-                self.position = player.position
-
-    def simulate_own_shot(self, angle, energy):
+    def load_field(self, field):
+        # takes the arrays as they are, pass a snapshot of a field that keeps changing
+        self.initialized = True
+        self.field = field
+        self.own_id = field.own_id
+        if self.verbose:
+            print(f"field: {len(field.planet_ids)} planets, players {field.player_ids.tolist()}, own id {field.own_id}")
+            for position, radius, mass in zip(field.planet_pos, field.planet_radius, field.planet_mass):
+                print(f"planet at ({round(position[0])},{round(position[1])}) radius {radius} mass {mass}")
+
+        own_position = field.position(field.own_id)
+        if own_position is not None:
+            self.position = own_position
+
+        self.planet_pos = field.planet_pos
+        self.planet_radius = field.planet_radius
+        self.planet_mass = field.planet_mass
+        self.planet_ids = field.planet_ids
+        self.player_pos = field.player_pos
+        self.player_ids = field.player_ids
+        self.own_index = field.rows.get(field.own_id, -1)
+        # the scalar integrator walks these instead of planet objects
+        self.planet_terms = list(zip(self.planet_pos, self.planet_mass.tolist()))
+        # gravitational potential at every opponent, a missile needs at least the lowest one to reach anybody
+        opponents = self.player_pos[self.player_ids != field.own_id]
+        self.opponent_potential = -(self.planet_mass[None, :] /
+                                    np.sqrt(((opponents[:, None, :] - self.planet_pos[None]) ** 2).sum(axis=2))
+                                    ).sum(axis=1)
+        # the gravity field table and the hit map stay as long as their layout key does, player updates keep them
+        self.layout_key = SolutionCache.key(self.planet_pos, self.planet_radius, self.planet_mass, (), ())
+
+        # collision candidates per battlefield cell, players reach as far as left_source is checked
+        bounds = (-self.margin, -self.margin,
+                  self.battlefieldW + self.margin, self.battlefieldH + self.margin)
+        planet_cells = None
+        if self.layout_cache is not None:
+            planet_cells = self.layout_cache.get(
+                self.layout_key, "planet_cells",
+                lambda: SpatialIndex(bounds, self.indexCellSize, self.planet_pos, self.planet_radius,
+                                     np.zeros((0, 2)), 0.0).planets)
+        self.index = SpatialIndex(bounds, self.indexCellSize, self.planet_pos, self.planet_radius,
+                                  self.player_pos, self.playerSize + 1.0, planet_cells)
+
+        if self.search_pool is not None:
+            self.search_pool.set_field(field)
+
+        # cached solutions may now be blocked by moved players, re-check them on next use
+        self.solution_cache.invalidate()
+
+    def simulate_own_shot(self, angle, energy, max_segments=None, trace=True, decimation=1, dtype=np.float64,
+                          early_exit=False):
+        # trace=False returns None instead of the trace, decimation keeps every k-th point plus the last
+        missile_result, info, length = self._simulate_own_shot(angle, energy, max_segments, early_exit)
+        if not trace:
+            return missile_result, info, None
+        points = self.trace_buffer[:length]
+        if decimation > 1 and length:
+            points = points[np.r_[0:length - 1:decimation, length - 1]]
+        return missile_result, info, points.astype(dtype)
+
+    def render_trace(self, angle, energy):
+        return self.simulate_own_shot(angle, energy, decimation=self.renderTraceDecimation, dtype=np.float32)[2]
+
+    def _simulate_own_shot(self, angle, energy, max_segments=None, early_exit=False):
+        # fills trace_buffer[:length], the buffer is reused by the next call
+        max_segments = self.maxSegments if max_segments is None else max_segments
+        if len(self.trace_buffer) < max_segments:
+            self.trace_buffer = np.empty((max_segments, 2))
+        buffer = self.trace_buffer
+        length = 0
         missile = utils.Missile(self.position, -angle + 90, energy)
         # print(f"{angle}° {energy}")
-        missile_trace = []
         missile_result = utils.MissileResult.RES_UNDETERMINED
         info = 0
         sim_running = True
@@ -94,52 +191,66 @@ class SimulationHandler:
         missile_speed = missile.speed
 
         while sim_running:
-            for planet in self.planets:
-                # calculate vector from planet to missile and distance
-                tmp_v = planet.position - missile_pos
-                distance = np.linalg.norm(tmp_v)
-
-                # collision with planet?
-                if distance <= planet.radius:
+            # collision with planet? only planets reaching into the current cell
+            for k in self.index.planets[self.index.cell(missile_pos)]:
+                distance = np.linalg.norm(self.planet_pos[k] - missile_pos)
+                if distance <= self.planet_radius[k]:
                     missile_result = utils.MissileResult.RES_HIT_PLANET
-                    info = planet.id
+                    info = int(self.planet_ids[k])
                     sim_running = False
                     break
 
+            if not sim_running:
+                break
+
+            for planet_position, planet_mass in self.planet_terms:
+                # calculate vector from planet to missile and distance
+                tmp_v = planet_position - missile_pos
+                distance = np.linalg.norm(tmp_v)
+
                 # normalize tmp vector
                 tmp_v /= distance
                 # apply Newtonian Gravity
-                tmp_v *= planet.mass / (distance**2)
+                tmp_v *= planet_mass / (distance**2)
                 # shortening to segment
                 tmp_v /= self.segmentSteps
 
                 # add tmp vector to missile speed vector
                 missile_speed += tmp_v
 
-            if not sim_running:
-                break
-
             # shortening resulting speed to segment
             tmp_v = missile_speed / self.segmentSteps
-            # apply speed vector
-            new_missile_pos = missile_pos + tmp_v
+            # apply speed vector, straight into the next trace row
+            new_missile_pos = buffer[length]
+            np.add(missile_pos, tmp_v, out=new_missile_pos)
+
+            # check if missile hit a player, only players reaching into the new cell
+            # own player outside the cell is farther than playerSize + 1.0 away
+            own_pending = not missile.left_source
+            for k in self.index.players[self.index.cell(new_missile_pos)]:
+                if own_pending and k > self.own_index:
+                    missile.left_source = True
+                    own_pending = False
 
-            # check if missile hit a player
-            for player in self.players:
-                distance = np.linalg.norm(player.position - new_missile_pos)
+                distance = np.linalg.norm(self.player_pos[k] - new_missile_pos)
 
                 if distance <= self.playerSize and missile.left_source:
                     missile_result = utils.MissileResult.RES_HIT_PLAYER
-                    info = player.id
+                    info = int(self.player_ids[k])
                     sim_running = False
                     break
 
-                if distance > self.playerSize + 1.0 and player.id == self.own_id:
-                    missile.left_source = True
+                if k == self.own_index:
+                    own_pending = False
+                    if distance > self.playerSize + 1.0:
+                        missile.left_source = True
 
             if not sim_running:
                 break
 
+            if own_pending:
+                missile.left_source = True
+
             # check if missile is out of bounds
             if new_missile_pos[0] < -self.margin or \
                     new_missile_pos[0] > self.battlefieldW + self.margin or \
@@ -148,19 +259,423 @@ class SimulationHandler:
                 missile_result = utils.MissileResult.RES_OUT_OF_BOUNDS
                 break
 
-            missile_trace.append(new_missile_pos)
-            if len(missile_trace) >= self.maxSegments:
+            length += 1
+            if length >= max_segments:
                 missile_result = utils.MissileResult.RES_OUT_OF_SEGMENTS
                 break
-            
+
+            if early_exit and length % self.earlyExitInterval == 0:
+                hopeless = self._hopeless(new_missile_pos[:1], new_missile_pos[1:], missile_speed[:1],
+                                          missile_speed[1:])[0]
+                if hopeless != utils.MissileResult.RES_UNDETERMINED.value:
+                    missile_result = utils.MissileResult(int(hopeless))
+                    break
+
             missile_pos = new_missile_pos
 
-        return missile_result, info, np.array(missile_trace)
+        metrics.count("simulations")
+        metrics.count("segments", length)
+        return missile_result, info, length
+
+    def get_gravity_field(self):
+        # sampled once per planet layout
+        if self.gravity_field is None or self.gravity_field_key != self.layout_key:
+            bounds = (-self.margin, -self.margin,
+                      self.battlefieldW + self.margin, self.battlefieldH + self.margin)
+
+            def build():
+                return GravityField(self.planet_pos, self.planet_radius, self.planet_mass, bounds,
+                                    self.gravityFieldResolution, self.gravityFieldExactMargin)
+
+            if self.layout_cache is not None:
+                self.gravity_field = self.layout_cache.get(self.layout_key, "gravity_field", build)
+            else:
+                self.gravity_field = build()
+            self.gravity_field_key = self.layout_key
+        return self.gravity_field
+
+    def get_atlas(self):
+        # only planets and our own position shape the fan, opponents moving keeps it valid
+        key = SolutionCache.key(self.planet_pos, self.planet_radius, self.planet_mass, self.position, ())
+        if key != self.atlas_key:
+            self.atlas = ShotAtlas(self)
+            self.atlas_key = key
+        return self.atlas
+
+    def simulate_shots(self, angles, energies, trace=True, chunk_size=None, approximate=False, ignore_players=False,
+                       adaptive=False, early_exit=False):
+        # batched version of simulate_own_shot, returns one (result, info, trace) per candidate
+        codes, infos, _, traces, _ = self.simulate_batch(angles, energies, trace, chunk_size, approximate,
+                                                      ignore_players, adaptive=adaptive, early_exit=early_exit)
+        results = []
+        for i in range(len(codes)):
+            results.append((utils.MissileResult(int(codes[i])), int(infos[i]),
+                            traces[i] if trace else None))
+        return results
+
+    def simulate_batch(self, angles, energies, trace=True, chunk_size=None, approximate=False,
+                       ignore_players=False, max_segments=None, target=None, adaptive=False, early_exit=False,
+                       checkpoint=None):
+        # closest is the nearest trace point to target per candidate, like calc_distance before its cutoff
+        # checkpoint(codes, infos, closest) sees the whole batch so far, running shots with their closest yet and
+        # RES_UNDETERMINED. Returning True stops the batch, shots still running or not started stay that way
+        # early_exit stops hopeless shots, see earlyExit, closest is then the nearest point before the stop
+        # adaptive takes longer steps away from planets and players, lengths still count substeps but traces
+        # only hold one point per step, it is for screening and drifts from the server, see adaptive_report
+        angles, energies = np.broadcast_arrays(np.asarray(angles, dtype=np.float64).ravel(),
+                                               np.asarray(energies, dtype=np.float64).ravel())
+        n = len(angles)
+        codes = np.full(n, utils.MissileResult.RES_UNDETERMINED.value, dtype=np.int64)
+        infos = np.zeros(n, dtype=np.int64)
+        lengths = np.zeros(n, dtype=np.int64)
+        closest = np.full(n, np.inf) if target is not None else None
+        traces = [] if trace else None
+        if chunk_size is None:
+            # trace buffers are chunk_size x maxSegments, keep them small
+            chunk_size = 256 if trace else 4096
+        field = self.get_gravity_field() if approximate and not adaptive else None
+        batch_checkpoint = None
+        if checkpoint is not None:
+            def batch_checkpoint():
+                return checkpoint(codes, infos, closest)
+
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            outputs = (codes[start:end], infos[start:end], lengths[start:end],
+                       closest[start:end] if target is not None else None)
+            chunk_traces, stopped = self._simulate_chunk(angles[start:end], energies[start:end], outputs, trace,
+                                                         field, ignore_players,
+                                                         self.maxSegments if max_segments is None else max_segments,
+                                                         target, adaptive, early_exit and not ignore_players,
+                                                         batch_checkpoint)
+            if trace:
+                traces.extend(chunk_traces)
+            if stopped:
+                if trace:
+                    traces.extend(np.array([]) for _ in range(end, n))
+                break
+
+        metrics.count("simulations", n)
+        metrics.count("segments", int(lengths.sum()))
+        return codes, infos, lengths, traces, closest
+
+    def _simulate_chunk(self, angles, energies, outputs, trace, field, ignore_players, max_segments, target,
+                        adaptive=False, early_exit=False, checkpoint=None):
+        # (traces, stopped), traces of stopped shots end where they were
+        codes, infos, lengths, closest = outputs
+        n = len(angles)
+        # same launch vector as utils.Missile
+        launch = np.radians(-angles + 90)
+        vx = energies * np.cos(launch)
+        vy = energies * -np.sin(launch)
+        px = np.full(n, self.position[0])
+        py = np.full(n, self.position[1])
+        left_source = np.zeros(n, dtype=bool)
+        count = np.zeros(n, dtype=np.int64)
+        # trace rows written, only differs from count when adaptive steps skip substeps
+        points = np.zeros(n, dtype=np.int64) if adaptive else count
+        trace_lengths = np.zeros(n, dtype=np.int64) if adaptive else lengths
+        idx = np.arange(n)
+        nearest = np.full(n, np.inf)
+        steps = 0
+        stopped = False
+
+        trace_buf = np.empty((n, max_segments, 2)) if trace else None
+
+        min_x = -self.margin
+        max_x = self.battlefieldW + self.margin
+        min_y = -self.margin
+        max_y = self.battlefieldH + self.margin
+
+        # without opponents only our own player is left, it still decides left_source
+        players = [self.own_index] if ignore_players else range(len(self.player_ids))
+
+        while len(idx):
+            m = len(idx)
+            done = np.zeros(m, dtype=bool)
+            result = np.full(m, utils.MissileResult.RES_UNDETERMINED.value, dtype=np.int64)
+            info = np.zeros(m, dtype=np.int64)
+
+            stride = None
+            if adaptive:
+                hit_rows, hit_ids, vx, vy, stride = self._adaptive_step(px, py, vx, vy, players, target,
+                                                                        max_segments - count)
+            elif field is None:
+                hit_rows, hit_ids, vx, vy = self._planet_step(px, py, vx, vy)
+            else:
+                # interpolated field everywhere, exact per-planet sum near planet surfaces
+                near, gx, gy = field.sample(px, py)
+                hit_rows = np.zeros(m, dtype=bool)
+                hit_ids = np.zeros(m, dtype=np.int64)
+                near = np.flatnonzero(near)
+                near_vx = vx[near]
+                near_vy = vy[near]
+                vx = vx + gx / self.segmentSteps
+                vy = vy + gy / self.segmentSteps
+                if len(near):
+                    hit_rows[near], hit_ids[near], vx[near], vy[near] = \
+                        self._planet_step(px[near], py[near], near_vx, near_vy)
+
+            if hit_rows.any():
+                done |= hit_rows
+                result[hit_rows] = utils.MissileResult.RES_HIT_PLANET.value
+                info[hit_rows] = hit_ids[hit_rows]
+
+            # apply speed vector
+            if stride is None:
+                new_px = px + vx / self.segmentSteps
+                new_py = py + vy / self.segmentSteps
+            else:
+                new_px = px + vx * stride / self.segmentSteps
+                new_py = py + vy * stride / self.segmentSteps
+
+            # check if missile hit a player
+            for k in players:
+                distance = np.sqrt((self.player_pos[k, 0] - new_px) ** 2 +
+                                   (self.player_pos[k, 1] - new_py) ** 2)
+                player_hit = (distance <= self.playerSize) & left_source & ~done
+                if player_hit.any():
+                    done |= player_hit
+                    result[player_hit] = utils.MissileResult.RES_HIT_PLAYER.value
+                    info[player_hit] = self.player_ids[k]
+                if self.player_ids[k] == self.own_id:
+                    left_source |= (distance > self.playerSize + 1.0) & ~done
+
+            # check if missile is out of bounds
+            out = ~done & ((new_px < min_x) | (new_px > max_x) | (new_py < min_y) | (new_py > max_y))
+            done |= out
+            result[out] = utils.MissileResult.RES_OUT_OF_BOUNDS.value
+
+            running = ~done
+            if target is not None:
+                distance = np.sqrt((new_px - target[0]) ** 2 + (new_py - target[1]) ** 2)
+                nearest = np.where(running, np.minimum(nearest, distance), nearest)
+            if trace:
+                trace_buf[idx[running], points[running], 0] = new_px[running]
+                trace_buf[idx[running], points[running], 1] = new_py[running]
+            if adaptive:
+                points[running] += 1
+                count[running] += stride[running]
+            else:
+                count[running] += 1
+            out = running & (count >= max_segments)
+            done |= out
+            result[out] = utils.MissileResult.RES_OUT_OF_SEGMENTS.value
+
+            # same substeps as the scalar check, adaptive rows get checked every that many steps instead
+            steps += 1
+            if early_exit and steps % self.earlyExitInterval == 0:
+                rows = np.flatnonzero(~done)
+                hopeless = self._hopeless(new_px[rows], new_py[rows], vx[rows], vy[rows])
+                stop = hopeless != utils.MissileResult.RES_UNDETERMINED.value
+                done[rows[stop]] = True
+                result[rows[stop]] = hopeless[stop]
+
+            if done.any():
+                finished = idx[done]
+                codes[finished] = result[done]
+                infos[finished] = info[done]
+                lengths[finished] = count[done]
+                if adaptive:
+                    trace_lengths[finished] = points[done]
+                if target is not None:
+                    closest[finished] = nearest[done]
+                running = ~done
+                idx = idx[running]
+                px = new_px[running]
+                py = new_py[running]
+                vx = vx[running]
+                vy = vy[running]
+                left_source = left_source[running]
+                count = count[running]
+                points = points[running] if adaptive else count
+                nearest = nearest[running]
+            else:
+                px = new_px
+                py = new_py
+
+            if checkpoint is not None and steps % self.checkpointInterval == 0 and len(idx):
+                lengths[idx] = count
+                if adaptive:
+                    trace_lengths[idx] = points
+                if target is not None:
+                    closest[idx] = nearest
+                if checkpoint():
+                    stopped = True
+                    break
+
+        if not trace:
+            return None, stopped
+        return [trace_buf[i, :trace_lengths[i]].copy() if trace_lengths[i] else np.array([]) for i in range(n)], stopped
+
+    def gravity_field_report(self, angles, energies):
+        # accuracy of the interpolated field, per sample and on whole trajectories
+        report = self.get_gravity_field().error_report()
+        exact = self.simulate_shots(angles, energies)
+        approx = self.simulate_shots(angles, energies, approximate=True)
+
+        same_result = 0
+        end_errors = []
+        for (res, info, trace), (approx_res, approx_info, approx_trace) in zip(exact, approx):
+            if res == approx_res and info == approx_info:
+                same_result += 1
+            if len(trace) and len(approx_trace):
+                end_errors.append(np.linalg.norm(trace[-1] - approx_trace[-1]))
+
+        report["shots"] = len(exact)
+        report["same_result"] = same_result / max(len(exact), 1)
+        report["end_error_mean"] = float(np.mean(end_errors)) if end_errors else 0.0
+        report["end_error_max"] = float(np.max(end_errors)) if end_errors else 0.0
+        return report
+
+    def adaptive_report(self, angles, energies, target=None):
+        # drift of the adaptive mode against the exact one, with the time each took
+        start = time.perf_counter()
+        codes, infos, _, traces, closest = self.simulate_batch(angles, energies, target=target)
+        exact_time = time.perf_counter() - start
+        start = time.perf_counter()
+        adaptive_codes, adaptive_infos, _, adaptive_traces, adaptive_closest = \
+            self.simulate_batch(angles, energies, target=target, adaptive=True)
+        adaptive_time = time.perf_counter() - start
+
+        same = (codes == adaptive_codes) & (infos == adaptive_infos)
+        end_errors = [np.linalg.norm(trace[-1] - adaptive_trace[-1])
+                      for trace, adaptive_trace in zip(traces, adaptive_traces)
+                      if len(trace) and len(adaptive_trace)]
+        steps = sum(len(trace) for trace in traces)
+        adaptive_steps = sum(len(trace) for trace in adaptive_traces)
+
+        report = {
+            "shots": len(codes),
+            "same_result": float(same.mean()) if len(codes) else 0.0,
+            "end_error_mean": float(np.mean(end_errors)) if end_errors else 0.0,
+            "end_error_max": float(np.max(end_errors)) if end_errors else 0.0,
+            "step_ratio": adaptive_steps / max(steps, 1),
+            "exact_seconds": exact_time,
+            "adaptive_seconds": adaptive_time,
+        }
+        if target is not None:
+            finite = np.isfinite(closest) & np.isfinite(adaptive_closest)
+            errors = np.abs(closest[finite] - adaptive_closest[finite])
+            report["closest_error_mean"] = float(errors.mean()) if len(errors) else 0.0
+            report["closest_error_max"] = float(errors.max()) if len(errors) else 0.0
+        return report
+
+    def _adaptive_step(self, px, py, vx, vy, players, target, remaining):
+        # like _planet_step, but picks how many substeps each missile advances and applies that much gravity
+        dx = self.planet_pos[None, :, 0] - px[:, None]
+        dy = self.planet_pos[None, :, 1] - py[:, None]
+        distance = np.sqrt(dx * dx + dy * dy)
+
+        planet_hit = distance <= self.planet_radius[None, :]
+        hit_rows = planet_hit.any(axis=1)
+        hit_ids = self.planet_ids[planet_hit.argmax(axis=1)]
+
+        scale = self.planet_mass[None, :] / distance ** 3
+        ax = (dx * scale).sum(axis=1)
+        ay = (dy * scale).sum(axis=1)
+
+        # distance covered per substep, the limits below are in substeps
+        step = np.maximum(np.sqrt(vx * vx + vy * vy), 1e-9) / self.segmentSteps
+        limit = self.adaptiveClearance * (distance - self.planet_radius[None, :]).min(axis=1) / step
+        accel = np.maximum(np.sqrt(ax * ax + ay * ay), 1e-12)
+        limit = np.minimum(limit, self.adaptiveVelocityChange * step * self.segmentSteps ** 2 / accel)
+        # never jump more than half the gap to a player, so no hit gets stepped over
+        for k in players:
+            gap = np.sqrt((self.player_pos[k, 0] - px) ** 2 + (self.player_pos[k, 1] - py) ** 2) - self.playerSize - 1.0
+            limit = np.minimum(limit, 0.5 * gap / step)
+        if target is not None:
+            gap = np.sqrt((target[0] - px) ** 2 + (target[1] - py) ** 2) - self.playerSize
+            limit = np.minimum(limit, 0.5 * gap / step)
+
+        stride = np.clip(np.floor(limit), 1, np.minimum(self.adaptiveMaxStride, remaining)).astype(np.int64)
+        vx = vx + ax * stride / self.segmentSteps
+        vy = vy + ay * stride / self.segmentSteps
+        return hit_rows, hit_ids, vx, vy, stride
+
+    def _planet_step(self, px, py, vx, vy):
+        # N x P vectors from missiles to planets
+        dx = self.planet_pos[None, :, 0] - px[:, None]
+        dy = self.planet_pos[None, :, 1] - py[:, None]
+        distance = np.sqrt(dx * dx + dy * dy)
+
+        # collision with planet? first planet in list order wins
+        planet_hit = distance <= self.planet_radius[None, :]
+        hit_rows = planet_hit.any(axis=1)
+        hit_ids = self.planet_ids[planet_hit.argmax(axis=1)]
+
+        # apply Newtonian Gravity, summed in planet order like the scalar loop
+        scale = self.planet_mass[None, :] / (distance ** 2)
+        ax = np.empty((len(px), len(self.planet_ids) + 1))
+        ay = np.empty((len(px), len(self.planet_ids) + 1))
+        ax[:, 0] = vx
+        ay[:, 0] = vy
+        np.divide(dx, distance, out=ax[:, 1:])
+        np.divide(dy, distance, out=ay[:, 1:])
+        ax[:, 1:] *= scale
+        ay[:, 1:] *= scale
+        ax[:, 1:] /= self.segmentSteps
+        ay[:, 1:] /= self.segmentSteps
+        return hit_rows, hit_ids, np.cumsum(ax, axis=1)[:, -1], np.cumsum(ay, axis=1)[:, -1]
+
+    def _hopeless(self, px, py, vx, vy):
+        # RES_ESCAPED or RES_UNREACHABLE per missile, RES_UNDETERMINED while it may still hit someone
+        dx = px[:, None] - self.planet_pos[None, :, 0]
+        dy = py[:, None] - self.planet_pos[None, :, 1]
+        distance = np.sqrt(dx * dx + dy * dy)
+        kinetic = 0.5 * (vx * vx + vy * vy)
+        energy = kinetic - (self.planet_mass[None, :] / distance).sum(axis=1)
+        result = np.full(len(px), utils.MissileResult.RES_UNDETERMINED.value, dtype=np.int64)
+
+        # moving away from every body, then either unbound or fast enough to cross the margin against the pull of
+        # every planet added up at its current distance. Partial pulls can cancel in the vector sum, their magnitudes
+        # can't, and that bound holds for as long as the missile keeps moving away from all of them
+        receding = (dx * vx[:, None] + dy * vy[:, None] > 0).all(axis=1)
+        receding &= ((px[:, None] - self.player_pos[None, :, 0]) * vx[:, None] +
+                     (py[:, None] - self.player_pos[None, :, 1]) * vy[:, None] > 0).all(axis=1)
+        pull = (self.planet_mass[None, :] / distance ** 2).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exit_x = np.where(vx > 0, self.battlefieldW + self.margin - px, -self.margin - px) / vx
+            exit_y = np.where(vy > 0, self.battlefieldH + self.margin - py, -self.margin - py) / vy
+        exit_distance = np.fmin(exit_x, exit_y) * np.sqrt(2.0 * kinetic)
+        escaped = (energy > self.earlyExitEscapeSlack * kinetic) | \
+                  (kinetic > self.earlyExitBoundsSlack * pull * exit_distance)
+        result[receding & escaped] = utils.MissileResult.RES_ESCAPED.value
+
+        if len(self.opponent_potential):
+            reach = self.opponent_potential.min()
+            unreachable = energy < reach - self.earlyExitReachSlack * abs(reach)
+
+            result[unreachable] = utils.MissileResult.RES_UNREACHABLE.value
+        return result
+
+    def best_hit(self, angles, energies, codes, infos, lengths):
+        # opponent hit with the shortest flight, as (angle, energy, player id, segments)
+        hits = np.flatnonzero((codes == utils.MissileResult.RES_HIT_PLAYER.value) & (infos != self.own_id))
+        if not len(hits):
+            return None
+        k = hits[np.argmin(lengths[hits])]
+        return float(angles[k]), float(energies[k]), int(infos[k]), int(lengths[k])
+
+    def search_shot(self, angle_data, energy_data, approximate=False):
+        # full angle x energy grid, split across the worker pool when there is one
+        angles, energies = np.meshgrid(np.arange(*angle_data), np.arange(*energy_data), indexing="ij")
+        angles = angles.ravel()
+        energies = energies.ravel()
+
+        if self.search_pool is not None:
+            result = self.search_pool.search(angles, energies, approximate)
+            if result is not None:
+                return result[0]
+
+        codes, infos, lengths, _, _ = self.simulate_batch(angles, energies, trace=False, approximate=approximate,
+                                                          early_exit=self.earlyExit)
+        return self.best_hit(angles, energies, codes, infos, lengths)
 
     def scan_angle(self, angle_data, energy_data):
-        for angle in np.arange(
-                *angle_data):  #, desc='angle', colour='red', leave=False):
-            res, info, trace = self.simulate_own_shot(angle, energy_data[0])
+        angles = np.arange(*angle_data)
+        results = self.simulate_shots(angles, energy_data[0], early_exit=self.earlyExit)
+        for angle, (res, info, trace) in zip(angles, results):
             if res == utils.MissileResult.RES_HIT_PLAYER and info != self.own_id:
                 print(
                     f"=====> Can hit other player with angle={angle} and vel={energy_data[0]}"
@@ -171,162 +686,108 @@ class SimulationHandler:
         else:
             print("No angle found")
 
-    def get_power_and_angle(self, event):
-        mouse_x, mouse_y = event.pos
-        offset_x = self.aimCircle.x + self.maxPower - mouse_x
-        offset_y = self.aimCircle.y + self.maxPower - mouse_y
-        self.power, self.angle = utils.cart2pol(offset_x, offset_y)
-        self.power = min(self.power, self.maxPower)
-        self.angle = math.degrees(self.angle)
-        self.angle = (self.angle + 270) % 360
+    def snapshot(self):
+        from Visualizer import Snapshot
+        return Snapshot(self.planet_pos, self.planet_radius, self.player_pos, self.player_ids, self.own_id,
+                        self.angle, self.power, self.lastTrace)
 
     def draw(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    # if self.aimCircle.collidepoint(event.pos):
-                    self.dragging = True
-                    self.get_power_and_angle(event)
-
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1:
-                    self.dragging = False
-
-            elif event.type == pygame.MOUSEMOTION:
-                if self.dragging:
-                    self.get_power_and_angle(event)
-            
-            elif event.type == pygame.KEYUP and event.key == K_SPACE:
-                self.find_solution()
-
-        self.surface.fill((0, 0, 0))
-
-        for planet in self.planets:
-            pygame.draw.lines(
-                self.surface, (77, 77, 77), True,
-                self.calc_surface_position(vertCircle * planet.radius +
-                                           planet.position), 2)
-
-        for player in self.players:
-            pygame.draw.circle(self.surface, self.calc_player_color(player.id),
-                               self.calc_surface_position(player.position),
-                               self.playerSize)
-            if player.id == self.own_id:
-                pygame.draw.line(
-                    self.surface, (255, 255, 255),
-                    self.calc_surface_position(player.position),
-                    self.calc_surface_position(player.position) +
-                    utils.pol2cart(self.power, np.deg2rad(self.angle - 90)))
-                self.aimCircle = pygame.draw.circle(
-                    self.surface, (255, 255, 255),
-                    self.calc_surface_position(player.position), self.maxPower,
-                    1)
-
-        # if (datetime.now() - self.lastTraceTime).microseconds > self.traceUpdateDelay:
-        #     _, _, trace = self.simulate_own_shot(self.angle, self.power)
-        #     self.lastTrace = self.calc_surface_position(trace)
-        #     self.lastTraceTime = datetime.now()
-
-        if (len(self.lastTrace) > 2):
-            pygame.draw.lines(self.surface, (255, 0, 0), False, self.lastTrace)
-
-        pygame.display.update()
-
-    def calc_surface_position(self, pos):
-        return pos * self.scaleFactor + self.globalOffset
-
-    def reshape(self, w, h):
-        ratioScreen = w / h
-        ratioSim = self.battlefieldW / self.battlefieldH
-        screenW = w
-        screenH = h
-
-        if ratioScreen > ratioSim:
-            self.top = 0.0
-            self.bottom = self.battlefieldH
-            self.left = -(self.battlefieldH * ratioScreen -
-                          self.battlefieldW) / 2.0
-            self.right = self.battlefieldW + (self.battlefieldH * ratioScreen -
-                                              self.battlefieldW) / 2.0
-        else:
-            self.top = -(self.battlefieldW / ratioScreen -
-                         self.battlefieldH) / 2.0
-            self.bottom = self.battlefieldH + (
-                self.battlefieldW / ratioScreen - self.battlefieldH) / 2.0
-            self.left = 0.0
-            self.right = self.battlefieldW
-
-        self.uiW = screenW if screenW > 1600 else screenW * 2 if screenW < 800 else 1600
-        self.uiH = self.uiW * screenH / screenW
-
-        self.scaleFactor = np.array([
-            screenW / self.battlefieldW * 0.8,
-            screenH / self.battlefieldH * 0.8
-        ])
-        self.globalOffset = np.array([self.uiW - screenW, self.uiH - screenH
-                                      ]) / 2 * self.scaleFactor
-
-    def calc_player_color(self, i):
-        return utils.hsv2rgb(
-            (360.0 / min(self.maxPlayers, 6) * i + (i / 6) * 30.0) / 360, 0.8,
-            1.0)
+        if self.visualizer is None or not self.initialized:
+            return
+        if self.visualizer.solve_requested:
+            self.visualizer.solve_requested = False
+            self.find_solution()
+        # only hands the frame over, drawing happens on the visualizer thread
+        self.visualizer.publish(self.snapshot())
+
+    def get_hit_map(self):
+        # swept again whenever the layout or any player changes, ranked() only knows where players were at the
+        # sweep. No early exit, escaping shots keep their out of bounds and out of segments labels
+        players = np.column_stack([self.player_ids, self.player_pos])
+        key = SolutionCache.key(self.planet_pos, self.planet_radius, self.planet_mass, self.position, players)
+        if key != self.hit_map_key:
+            angles = np.arange(0, 360, self.hitMapAngleStep)
+            energies = np.linspace(self.minEnergy, self.maxEnergy, self.hitMapEnergySteps)
+            grid_angles, grid_energies = np.meshgrid(angles, energies, indexing="ij")
+            codes, infos, _, _, _ = self.simulate_batch(grid_angles.ravel(), grid_energies.ravel(), trace=False,
+                                                        adaptive=self.hitMapAdaptive)
+            self.hit_map = HitMap(angles, energies, codes, infos)
+            self.hit_map_key = key
+        return self.hit_map
+
+    def hit_map_solution(self):
+        # widest hit region first, each pick confirmed exactly since the sweep may be adaptive
+        for player_id, depth, angle, energy in self.get_hit_map().ranked(exclude=(self.own_id,)):
+            if self.confirms_hit((angle, energy), player_id):
+                if self.verbose:
+                    print(f"hit map: player {player_id} at angle={angle} energy={energy}, depth {depth}")
+                return angle, energy, player_id
+        return None
+
+    def solve_shot(self, on_progress=None, cancelled=None):
+        # hit map, then per opponent the solution cache, the shot atlas and the solver, until one of them hits.
+        # Returns (Solution, player id) of that hit or of the closest miss, None without opponents. on_progress
+        # gets (Solution, player id) from the solver's stages, cancelled() ends the search early
+        if self.useHitMap:
+            picked = self.hit_map_solution()
+            if picked is not None:
+                angle, energy, player_id = picked
+                return utils.Solution(angle, energy, 0.0, True, 0), player_id
+
+        best = None
+        for player_id, position in zip(self.player_ids.tolist(), self.player_pos):
+            if player_id == self.own_id:
+                continue
+            key = self.solution_cache.key(self.planet_pos, self.planet_radius, self.planet_mass,
+                                          self.position, position)
+            cached = self.solution_cache.get(key, lambda solution: self.confirms_hit(solution, player_id))
+            if cached is not None:
+                return utils.Solution(*cached, 0.0, True, 0), player_id
+
+            if self.useShotAtlas:
+                aimed = self.get_atlas().aim(position, player_id)
+                if aimed is not None:
+                    self.solution_cache.put(key, aimed)
+                    return utils.Solution(*aimed, 0.0, True, 0), player_id
+
+            progress = None
+            if on_progress is not None:
+                def progress(solution, player_id=player_id):
+                    on_progress(solution, player_id)
+            solution = self.solver.solve(position, player_id, on_progress=progress, cancelled=cancelled)
+            if self.verbose:
+                print(f"solved for player {player_id}: angle={solution.angle} energy={solution.energy} "
+                      f"distance={solution.distance} after {solution.simulations} simulations")
+            if solution.hit:
+                self.solution_cache.put(key, (solution.angle, solution.energy))
+                return solution, player_id
+            if best is None or solution.distance < best[0].distance:
+                best = solution, player_id
+            if cancelled is not None and cancelled():
+                break
+        return best
 
     def find_solution(self):
-        for player in self.players:
-            if player.id != self.own_id:
-                rel_position = player.position - self.position
-                _, initialAngle = utils.cart2pol(rel_position[0], rel_position[1])
-                initialAngle = (math.degrees(initialAngle) + 90) % 360
-                self.angle = initialAngle
-                print(initialAngle)
-
-                minangle = 1
-                maxangle = 36000
-                minpower = 0
-                maxpower = 2000
-                power = 10
-                distance = 1
-                while True:
-                    print(f"maxangle {maxangle} minangle {minangle}")
-                    angle = (maxangle + minangle) // 2
-                    while True:
-                        power = (maxpower + minpower) // 2
-                        distance = self.calc_distance((angle / 100, power / power), player.position)
-                    if distance == 0:
-                        break
-
-                    if maxangle - minangle == 1:
-                        break
-                    
-                    # find out if too high or too low
-                    tmp_angle = angle - 1
-                    newdistance = self.calc_distance((tmp_angle / 100, power), player.position)
-                    if newdistance == 0:
-                        break
-
-                    if newdistance < distance:
-                        # we were too high
-                        maxangle = tmp_angle
-                    else:
-                        # we were too low
-                        minangle = angle
-
-                #ret = optimize.minimize(self.calc_distance, [initialAngle, random.randint(1, 10)], tol=0.05, bounds=optimize.Bounds([0, 0], [360, 20]), args=(player.position,))
-                #angle, power = ret.x
-                #print(ret)
-                _, _, trace = self.simulate_own_shot(angle / 100, power)
-                self.lastTrace = self.calc_surface_position(trace)
-
-                return angle / 100, power
+        found = self.solve_shot()
+        if found is None:
+            return None
+        solution, _ = found
+        self.angle = solution.angle
+        self.power = solution.energy
+        self.lastTrace = self.render_trace(solution.angle, solution.energy)
+        return solution.angle, solution.energy
+
+    def confirms_hit(self, solution, player_id):
+        res, info, _ = self.simulate_own_shot(*solution, trace=False)
+        return res == utils.MissileResult.RES_HIT_PLAYER and info == player_id
 
     def calc_distance(self, x, target):
         angle, energy = x
-        _, _, missile_trace = self.simulate_own_shot(angle, energy)
+        _, _, length = self._simulate_own_shot(angle, energy, early_exit=self.earlyExit)
 
-        min_distance = cdist(missile_trace, [target]).min()
+        # read straight from the trace buffer, nothing is copied
+        offset = self.trace_buffer[:length] - target
+        min_distance = np.sqrt(np.einsum("ij,ij->i", offset, offset).min())
 
         if (min_distance < self.playerSize / 0.8):
             min_distance = 0
@@ -1,22 +1,42 @@
+import select
 import socket
 import struct
 import sys
 
+import numpy as np
+
+
+RECV_BUFFER_SIZE = 1 << 16
+
 
 class SocketManager:
-    def __init__(self, ip, port, version, recv_timeout):
-        # set up socket and connect
+    def __init__(self, ip, port, version, recv_timeout, capture=None, sock=None):
+        # set up socket and connect, a given sock is already connected and past the greeting (see replay.py)
         self.connected = False
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket = sock or socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.ip = ip
         self.port = port
         self.bot_ver = version
         self.recv_timeout = recv_timeout
-        self.initialize()
+
+        # inbound bytes live in buffer[start:end], messages are parsed straight out of it
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.structs = {}
+        # SessionCapture recording everything received and sent from here on
+        self.capture = capture
+
+        if sock is None:
+            self.initialize()
+        else:
+            self.connected = True
 
     def initialize(self):
         self.connect()
         self.discard_all(1)
+        self.socket.settimeout(self.recv_timeout)
         self.send_str(f"b {self.bot_ver}")
 
     # receives and discards all packages until it times out
@@ -30,49 +50,133 @@ class SocketManager:
                 break
         self.socket.settimeout(timeout)
 
-    def receive_bytes(self, byte_count):
-        timeout = self.socket.gettimeout()
-        self.socket.settimeout(self.recv_timeout)
+    def fileno(self):
+        return self.socket.fileno()
 
-        buf = b''
-        while byte_count:
-            try:
-                new_buf = self.socket.recv(byte_count)
-                if not new_buf:
-                    print("Connection dropped unexpectedly during RECV.")
-                    exit(1)
+    def set_nonblocking(self):
+        # reads are driven by readiness from here on, fill() returns False instead of waiting
+        self.socket.setblocking(False)
 
-                buf += new_buf
-                byte_count -= len(new_buf)
-            except Exception:
-                buf = None
-                break
+    def buffered(self):
+        return self.end - self.start
 
-        self.socket.settimeout(timeout)
+    def fill(self):
+        # one recv for as much as fits, partial messages stay buffered across calls
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            pending = self.end - self.start
+            if self.start:
+                self.buffer[:pending] = self.buffer[self.start:self.end]
+            else:
+                # a single message larger than the buffer, grow it
+                self.view.release()
+                self.buffer.extend(bytes(len(self.buffer)))
+                self.view = memoryview(self.buffer)
+            self.start = 0
+            self.end = pending
+
+        try:
+            received = self.socket.recv_into(self.view[self.end:])
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            print(f"Connection dropped unexpectedly during RECV: {e}")
+            self.connected = False
+            return False
+        if not received:
+            # loops end once connected is False, other bots of the same process keep running
+            print("Connection dropped unexpectedly during RECV.")
+            self.connected = False
+            return False
+
+        if self.capture is not None:
+            self.capture.inbound(self.view[self.end:self.end + received])
+        self.end += received
+        return True
+
+    def ensure(self, byte_count):
+        while self.end - self.start < byte_count:
+            if not self.fill():
+                return False
+        return True
+
+    def receive_bytes(self, byte_count):
+        if not self.ensure(byte_count):
+            return None
+        buf = bytes(self.view[self.start:self.start + byte_count])
+        self.start += byte_count
         return buf
 
+    def receive_array(self, dtype, count):
+        # decodes a whole block of equal items at once, copied out so the buffer can move on
+        dtype = np.dtype(dtype)
+        if not self.ensure(dtype.itemsize * count):
+            return None
+        array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.start).copy()
+        self.start += dtype.itemsize * count
+        return array
+
+    def skip_bytes(self, byte_count):
+        if not self.ensure(byte_count):
+            return False
+        self.start += byte_count
+        return True
+
     def send_str(self, string):
+        # False once the connection is gone, the bot's loop ends on connected
+        if not self.connected:
+            return False
+
         # trim whitespaces and add newline
         string = f"{string.strip()}\n"
 
         # calculate payload size
         payload = bytes(string, 'UTF-8')
+        if self.capture is not None:
+            self.capture.outbound(payload)
         byte_count = len(payload)
         byte_i = 0
         while byte_i < byte_count:
-            new_bytes = self.socket.send(payload[byte_i:])
+            try:
+                new_bytes = self.socket.send(payload[byte_i:])
+            except BlockingIOError:
+                # send buffer full on a non-blocking socket, wait until it drains
+                select.select([], [self.socket], [])
+                continue
+            except OSError as e:
+                # like a dropped RECV, only this bot's loop ends
+                print(f"Connection dropped unexpectedly during SEND: {e}")
+                self.connected = False
+                return False
             if not new_bytes:
                 print("Connection dropped unexpectedly during SEND.")
-                exit(1)
+                self.connected = False
+                return False
 
             byte_i += new_bytes
         return True
 
+    def get_struct(self, struct_format):
+        unpacker = self.structs.get(struct_format)
+        if unpacker is None:
+            unpacker = self.structs[struct_format] = struct.Struct(struct_format)
+        return unpacker
+
+    def peek_struct(self, struct_format, offset=0):
+        # reads from what is already buffered without consuming it, None if not there yet
+        unpacker = self.get_struct(struct_format)
+        if self.end - self.start < offset + unpacker.size:
+            return None
+        return unpacker.unpack_from(self.buffer, self.start + offset)
+
     def receive_struct(self, struct_format):
-        byte_struct = self.receive_bytes(struct.calcsize(struct_format))
-        if not byte_struct:
+        unpacker = self.get_struct(struct_format)
+        if not self.ensure(unpacker.size):
             return None
-        return struct.unpack(struct_format, byte_struct)
+        values = unpacker.unpack_from(self.buffer, self.start)
+        self.start += unpacker.size
+        return values
 
     def close(self):
         sys.stdout.write("Closing socket connection...")
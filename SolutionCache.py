@@ -0,0 +1,91 @@
+import hashlib
+import shelve
+from collections import OrderedDict
+
+import numpy as np
+
+from Metrics import metrics
+
+
+class SolutionCache:
+    # LRU of solved (angle, power) per planet layout, own position and target position
+
+    def __init__(self, max_size=256, path=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.store = shelve.open(path) if path else None
+        # entries solved before the last layout change have to be re-checked before use
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def key(planet_pos, planet_radius, planet_mass, own_position, target_position):
+        digest = hashlib.sha1()
+        for array in (planet_pos, planet_radius, planet_mass, own_position, target_position):
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def invalidate(self):
+        self.generation += 1
+
+    def get(self, key, validate=None):
+        entry = self.entries.get(key)
+        if entry is None and self.store is not None and key in self.store:
+            # loaded from disk, the players around may have changed since it was solved
+            entry = (self.store[key], -1)
+
+        if entry is None:
+            self.misses += 1
+            metrics.count("solution_cache_misses")
+            return None
+
+        solution, generation = entry
+        if generation != self.generation:
+            if validate is not None and not validate(solution):
+                self.invalidated += 1
+                self.misses += 1
+                metrics.count("solution_cache_invalidated")
+                metrics.count("solution_cache_misses")
+                self.entries.pop(key, None)
+                if self.store is not None and key in self.store:
+                    del self.store[key]
+                return None
+
+        self.hits += 1
+        metrics.count("solution_cache_hits")
+        self._insert(key, solution)
+        return solution
+
+    def put(self, key, solution):
+        self._insert(key, solution)
+        if self.store is not None:
+            self.store[key] = solution
+            self.store.sync()
+
+    def _insert(self, key, solution):
+        self.entries[key] = (solution, self.generation)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            metrics.count("solution_cache_evictions")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+        }
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class SpatialIndex:
+    # uniform grid mapping battlefield cells to the planets and players that reach into them
+
+    def __init__(self, bounds, cell_size, planet_pos, planet_radius, player_pos, player_reach, planet_cells=None):
+        # planet_cells reuses .planets of an index over the same layout and bounds, only players get filled
+        self.min_x, self.min_y, max_x, max_y = bounds
+        self.cell_size = cell_size
+        self.nx = max(int(np.ceil((max_x - self.min_x) / cell_size)), 1)
+        self.ny = max(int(np.ceil((max_y - self.min_y) / cell_size)), 1)
+
+        self.planets = self._fill(planet_pos, planet_radius) if planet_cells is None else planet_cells
+        self.players = self._fill(player_pos, np.full(len(player_pos), player_reach))
+
+    def _fill(self, positions, reach):
+        cells = [[] for _ in range(self.nx * self.ny)]
+        for k, ((x, y), r) in enumerate(zip(positions, reach)):
+            i0, j0 = self.cell_coords(x - r, y - r)
+            i1, j1 = self.cell_coords(x + r, y + r)
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    # closest point of the cell rectangle to the body centre
+                    left = self.min_x + i * self.cell_size
+                    top = self.min_y + j * self.cell_size
+                    dx = x - min(max(x, left), left + self.cell_size)
+                    dy = y - min(max(y, top), top + self.cell_size)
+                    if dx * dx + dy * dy <= r * r:
+                        cells[i * self.ny + j].append(k)
+        # list order matches the field order, so the first hit stays the first hit
+        return [tuple(cell) for cell in cells]
+
+    def cell_coords(self, x, y):
+        i = min(max(int((x - self.min_x) // self.cell_size), 0), self.nx - 1)
+        j = min(max(int((y - self.min_y) // self.cell_size), 0), self.ny - 1)
+        return i, j
+
+    def cell(self, pos):
+        i, j = self.cell_coords(pos[0], pos[1])
+        return i * self.ny + j
@@ -0,0 +1,251 @@
+import _thread
+import math
+import threading
+
+import numpy as np
+
+import pygame
+from pygame.locals import *
+
+import utils
+
+vertCircle = np.zeros((32, 2))
+
+for i in range(8):
+    a = 2 * math.pi / 32 + 2 * math.pi / 16 * i
+    x = math.sin(a)
+    y = math.cos(a)
+    vertCircle[i][0] = x
+    vertCircle[i][1] = y
+    vertCircle[8 + i][0] = -x
+    vertCircle[8 + i][1] = -y
+    vertCircle[16 + 2 * i][0] = x
+    vertCircle[16 + 2 * i][1] = y
+    vertCircle[16 + 2 * i + 1][0] = -x
+    vertCircle[16 + 2 * i + 1][1] = -y
+
+
+class Snapshot:
+    # what one frame needs, the arrays are replaced (never mutated) by set_field so sharing them is safe
+    def __init__(self, planet_pos, planet_radius, player_pos, player_ids, own_id, angle, power, trace):
+        self.planet_pos = planet_pos
+        self.planet_radius = planet_radius
+        self.player_pos = player_pos
+        self.player_ids = player_ids
+        self.own_id = own_id
+        self.angle = angle
+        self.power = power
+        self.trace = trace
+
+
+class Visualizer:
+
+    def __init__(self, battlefieldW, battlefieldH, playerSize, maxPlayers, maxPower, fps=30, threaded=True):
+        self.battlefieldW = battlefieldW
+        self.battlefieldH = battlefieldH
+        self.playerSize = playerSize
+        self.maxPlayers = maxPlayers
+        self.maxPower = maxPower
+        self.fps = fps
+        self.threaded = threaded
+
+        self.display = (1120, 630)
+        self.reshape(self.display[0], self.display[1])
+
+        self.dragging = False
+        self.manual_aim = False
+        self.power = 0
+        self.angle = 0
+        self.aimCircle = None
+        # set by the space key, the owner runs the solver on its own thread
+        self.solve_requested = False
+
+        # planet outlines drawn once per layout, frames only blit it back under what changed
+        self.background = None
+        self.background_layout = None
+        # screen coordinates of the arrays they were computed from, snapshots replace arrays instead of mutating
+        self.player_source = None
+        self.player_screen = None
+        self.trace_source = None
+        self.trace_screen = None
+        self.dirty = []
+        self.frame = None
+
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.running = True
+
+        if threaded:
+            self.thread = threading.Thread(target=self.run, name="Visualizer", daemon=True)
+            self.thread.start()
+        else:
+            self.open()
+
+    def open(self):
+        pygame.init()
+        self.surface = pygame.display.set_mode(self.display)
+        pygame.display.set_caption("AppleBot")
+
+    def publish(self, snapshot):
+        if self.threaded:
+            with self.lock:
+                self.snapshot = snapshot
+        else:
+            self.handle_events()
+            self.draw(snapshot)
+
+    def run(self):
+        # window, events and drawing all stay on this thread
+        self.open()
+        clock = pygame.time.Clock()
+        while self.running:
+            try:
+                self.handle_events()
+                with self.lock:
+                    snapshot = self.snapshot
+                if snapshot is not None:
+                    self.draw(snapshot)
+            except pygame.error:
+                # pygame shuts down at interpreter exit while this daemon thread may still be drawing
+                break
+            clock.tick(self.fps)
+
+    def stop(self):
+        self.running = False
+
+    def get_power_and_angle(self, event):
+        mouse_x, mouse_y = event.pos
+        offset_x = self.aimCircle.x + self.maxPower - mouse_x
+        offset_y = self.aimCircle.y + self.maxPower - mouse_y
+        self.power, self.angle = utils.cart2pol(offset_x, offset_y)
+        self.power = min(self.power, self.maxPower)
+        self.angle = math.degrees(self.angle)
+        self.angle = (self.angle + 270) % 360
+        self.manual_aim = True
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                self.running = False
+                # closing the window stops the bot like it did when drawing was inline
+                _thread.interrupt_main()
+                return
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1 and self.aimCircle is not None:
+                    # if self.aimCircle.collidepoint(event.pos):
+                    self.dragging = True
+                    self.get_power_and_angle(event)
+                    self.frame = None
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    self.dragging = False
+
+            elif event.type == pygame.MOUSEMOTION:
+                if self.dragging:
+                    self.get_power_and_angle(event)
+                    self.frame = None
+
+            elif event.type == pygame.KEYUP and event.key == K_SPACE:
+                self.solve_requested = True
+
+    def render_background(self, snapshot):
+        self.background = pygame.Surface(self.display)
+        self.background.fill((0, 0, 0))
+        outlines = vertCircle[None, :, :] * snapshot.planet_radius[:, None, None] + snapshot.planet_pos[:, None, :]
+        for outline in self.calc_surface_position(outlines):
+            pygame.draw.lines(self.background, (77, 77, 77), True, outline, 2)
+        self.background_layout = (snapshot.planet_pos, snapshot.planet_radius)
+
+    def draw(self, snapshot):
+        angle = self.angle if self.manual_aim else snapshot.angle
+        power = self.power if self.manual_aim else snapshot.power
+
+        # nothing moved since the last frame
+        frame = (snapshot.planet_pos, snapshot.player_pos, snapshot.trace, snapshot.own_id, angle, power)
+        if self.frame is not None and all(a is b for a, b in zip(frame[:3], self.frame[:3])) and \
+                frame[3:] == self.frame[3:]:
+            return
+
+        full = False
+        if self.background is None or self.background_layout[0] is not snapshot.planet_pos or \
+                self.background_layout[1] is not snapshot.planet_radius:
+            self.render_background(snapshot)
+            full = True
+        if self.player_source is not snapshot.player_pos:
+            self.player_screen = self.calc_surface_position(snapshot.player_pos)
+            self.player_source = snapshot.player_pos
+        if self.trace_source is not snapshot.trace:
+            self.trace_screen = self.calc_surface_position(snapshot.trace) if len(snapshot.trace) > 2 else None
+            self.trace_source = snapshot.trace
+
+        # put the background back under everything the last frame drew
+        if full:
+            self.surface.blit(self.background, (0, 0))
+        else:
+            for rect in self.dirty:
+                self.surface.blit(self.background, rect, rect)
+
+        rects = []
+        for position, player_id in zip(self.player_screen, snapshot.player_ids):
+            rects.append(pygame.draw.circle(self.surface, self.calc_player_color(player_id), position,
+                                            self.playerSize))
+            if player_id == snapshot.own_id:
+                rects.append(pygame.draw.line(
+                    self.surface, (255, 255, 255), position,
+                    position + utils.pol2cart(power, np.deg2rad(angle - 90))))
+                self.aimCircle = pygame.draw.circle(self.surface, (255, 255, 255), position, self.maxPower, 1)
+                rects.append(self.aimCircle)
+
+        if self.trace_screen is not None:
+            rects.append(pygame.draw.lines(self.surface, (255, 0, 0), False, self.trace_screen))
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.dirty + rects)
+        self.dirty = rects
+        self.frame = frame
+
+    def calc_surface_position(self, pos):
+        return pos * self.scaleFactor + self.globalOffset
+
+    def reshape(self, w, h):
+        self.background = None
+        self.player_source = None
+        self.trace_source = None
+        ratioScreen = w / h
+        ratioSim = self.battlefieldW / self.battlefieldH
+        screenW = w
+        screenH = h
+
+        if ratioScreen > ratioSim:
+            self.top = 0.0
+            self.bottom = self.battlefieldH
+            self.left = -(self.battlefieldH * ratioScreen -
+                          self.battlefieldW) / 2.0
+            self.right = self.battlefieldW + (self.battlefieldH * ratioScreen -
+                                              self.battlefieldW) / 2.0
+        else:
+            self.top = -(self.battlefieldW / ratioScreen -
+                         self.battlefieldH) / 2.0
+            self.bottom = self.battlefieldH + (
+                self.battlefieldW / ratioScreen - self.battlefieldH) / 2.0
+            self.left = 0.0
+            self.right = self.battlefieldW
+
+        self.uiW = screenW if screenW > 1600 else screenW * 2 if screenW < 800 else 1600
+        self.uiH = self.uiW * screenH / screenW
+
+        self.scaleFactor = np.array([
+            screenW / self.battlefieldW * 0.8,
+            screenH / self.battlefieldH * 0.8
+        ])
+        self.globalOffset = np.array([self.uiW - screenW, self.uiH - screenH
+                                      ]) / 2 * self.scaleFactor
+
+    def calc_player_color(self, i):
+        return utils.hsv2rgb(
+            (360.0 / min(self.maxPlayers, 6) * i + (i / 6) * 30.0) / 360, 0.8,
+            1.0)
@@ -1,40 +1,78 @@
-from datetime import datetime
-
+import selectors
+import struct
+import time
+
+from BackgroundSolver import BackgroundSolver
+from Field import Field
+from Metrics import metrics
+from Profiler import profiler
 from SimulationHandler import SimulationHandler
 from utils import *
 
 ENERGY_UPDATE_INTERVAL = 2
 SCAN_INTERVAL = 1
+# a due scan that found nothing to fire is retried this often
+SCAN_RETRY_INTERVAL = 0.1
+
+# body size after the II header for messages that have a fixed one, 6 and 9 carry their length
+MESSAGE_BODY_SIZES = {1: 0, 2: 0, 3: 8, 4: 0, 5: 16, 7: 0, 8: 8}
 
 
 class AppleBot:
-    def __init__(self, socket_manager):
+    def __init__(self, socket_manager, search_workers=0, cache_path=None, background_solver=False,
+                 keep_opponent_traces=False, headless=False, visualizer_fps=30, name=None, layout_cache=None,
+                 selector=None):
         self.connection = socket_manager
-        self.simulation = SimulationHandler()
+        # the worker pool and the cache file go to whichever handler does the solving
+        self.simulation = SimulationHandler(headless=headless,
+                                            search_workers=0 if background_solver else search_workers,
+                                            cache_path=None if background_solver else cache_path,
+                                            visualizer_fps=visualizer_fps, layout_cache=layout_cache)
+        # solves off the network loop, simulate() then fires the best solution found so far
+        self.background_solver = BackgroundSolver(layout_cache, search_workers, cache_path) \
+            if background_solver else None
 
         self.id = -1
-        self.name = self.__class__.__name__
-        self.planets = []
-        self.players = {}
+        self.name = name or self.__class__.__name__
+        # planets and players, updated in place by process_incoming, the simulation gets snapshots
+        self.field = Field()
         self.angle = 0
         self.speed = 10
         self.last_shot = []
         self.energy = 0
-
-        self.last_energy_update = datetime.now()
-        self.last_scan = datetime.now()
+        # last shot trace per player as (n, 2) float32, only filled with keep_opponent_traces
+        self.keep_opponent_traces = keep_opponent_traces
+        self.opponent_traces = {}
+
+        # monotonic timers, loop() sleeps in select until the next one is due or a packet arrives
+        self.last_energy_update = time.monotonic()
+        self.last_scan = time.monotonic()
+        self.last_scan_attempt = self.last_scan
+        # a runner driving several bots passes one selector for all of them, the bot is the key's data
+        self.connection.set_nonblocking()
+        self.selector = selector or selectors.DefaultSelector()
+        self.selector.register(self.connection, selectors.EVENT_READ, self)
 
         self.init()
 
     def init(self):
         self.connection.send_str(f"n {self.name}")
 
+    def close(self):
+        # stops the solver thread and worker processes and closes the solution cache file
+        if self.background_solver is not None:
+            self.background_solver.stop()
+        self.simulation.close()
+
     def msg(self, message):
-        print(f"[{self.__class__.__name__}]: {message}")
+        print(f"[{self.name}]: {message}")
 
     def shoot(self):
+        start = metrics.now()
         self.connection.send_str(f"v {self.power}")
         self.connection.send_str(f"{(-self.angle + 90) % 360}")
+        metrics.observe("shoot", start)
+        metrics.count("shots")
 
     def report_shot(self, curve):
         self.last_shot = curve
@@ -42,11 +80,33 @@ class AppleBot:
     def update_simulation(self):
         if self.id == -1:
             return
-        if not self.planets:
+        if not len(self.field.planet_ids):
             return
-        if not self.players:
+        if not self.field.has_player(self.id):
             return
-        self.simulation.set_field(self.planets, self.players.values(), self.id)
+        start = metrics.now()
+        field = self.field.snapshot()
+        self.simulation.load_field(field)
+        if self.background_solver is not None:
+            self.background_solver.restart(field)
+        metrics.observe("update_simulation", start)
+
+    def message_ready(self):
+        # only parse once the whole message is buffered, so a slow packet never blocks the loop
+        header = self.connection.peek_struct("II")
+        if header is None:
+            return False
+        msg_type, payload = header
+        if msg_type == 6:
+            body = self.connection.peek_struct("ddI", 8)
+            if body is None:
+                return False
+            size = struct.calcsize("ddI") + struct.calcsize("ff") * body[2]
+        elif msg_type == 9:
+            size = struct.calcsize("I") + struct.calcsize("dddd") * payload
+        else:
+            size = MESSAGE_BODY_SIZES.get(msg_type, 0)
+        return self.connection.buffered() >= 8 + size
 
     def process_incoming(self):
         struct_data = self.connection.receive_struct("II")
@@ -56,26 +116,28 @@ class AppleBot:
             return
 
         msg_type, payload = struct_data
+        # layout messages include their update_simulation, which is also measured on its own
+        start = metrics.now()
 
         # bot has joined
         if msg_type == 1:
             self.id = payload
+            self.field.own_id = payload
             self.msg(f"set id to {payload}")
             self.update_simulation()
 
         # player left
         elif msg_type == 2:
-            del self.players[payload]
+            self.field.remove_player(payload)
             self.update_simulation()
 
         # player joined/reset
         elif msg_type == 3:
             x, y = self.connection.receive_struct("ff")
-            if payload not in self.players:
+            if self.field.set_player(payload, x, y):
                 self.msg(f"player {payload} joined the game at ({round(x)},{round(y)})")
             else:
                 self.msg(f"player {payload} moved to ({round(x)},{round(y)})")
-            self.players[payload] = Player(x, y, payload)
             self.update_simulation()
 
         # shot finished msg, deprecated
@@ -88,11 +150,13 @@ class AppleBot:
             angle, velocity = self.connection.receive_struct("dd")
             self.msg(f"player {payload} launched a missile with angle {round(angle, 3)}° and velocity {velocity}")
 
-        # shot end (discard shot data)
+        # shot end (discard shot data unless we keep opponent traces)
         elif msg_type == 6:
             angle, velocity, length = self.connection.receive_struct("ddI")
-            for i in range(length):
-                _ = self.connection.receive_struct("ff")
+            if self.keep_opponent_traces:
+                self.opponent_traces[payload] = self.connection.receive_array("f", 2 * length).reshape(-1, 2)
+            else:
+                self.connection.skip_bytes(struct.calcsize("ff") * length)
 
         # game mode, deprecated
         elif msg_type == 7:
@@ -108,37 +172,70 @@ class AppleBot:
             # discard planet byte count
             self.connection.receive_struct("I")
 
-            self.planets = []
-            for i in range(payload):
-                x, y, radius, mass = self.connection.receive_struct("dddd")
-                self.planets.append(Planet(x, y, radius, mass, i))
-            self.msg(f"planet data for {len(self.planets)} planets received")
-            tmp = self.planets[-1]
+            self.field.set_planets(self.connection.receive_array("d", 4 * payload))
+            self.msg(f"planet data for {payload} planets received")
             self.update_simulation()
 
         # unknown MSG_TYPE
         else:
             self.msg(f"Unexpected message_type: '{msg_type}'\n\t- data: '{payload}'")
 
-    def loop(self):
+        metrics.observe("parse", start, (("msg_type", msg_type),))
+
+    def next_deadline(self):
+        next_energy_update = self.last_energy_update + ENERGY_UPDATE_INTERVAL
+        next_scan = max(self.last_scan + SCAN_INTERVAL, self.last_scan_attempt + SCAN_RETRY_INTERVAL)
+        return min(next_energy_update, next_scan)
 
-        if (datetime.now() - self.last_energy_update).seconds > ENERGY_UPDATE_INTERVAL:
+    def on_readable(self):
+        start = metrics.now()
+        self.connection.fill()
+        metrics.observe("receive", start)
+        while self.message_ready():
+            self.process_incoming()
+
+    def on_timers(self, now):
+        if now >= self.last_energy_update + ENERGY_UPDATE_INTERVAL:
             self.connection.send_str("u")
-            self.last_energy_update = datetime.now()
+            self.last_energy_update = now
 
-        if (datetime.now() - self.last_scan).seconds > SCAN_INTERVAL:
+        if now >= max(self.last_scan + SCAN_INTERVAL, self.last_scan_attempt + SCAN_RETRY_INTERVAL):
+            self.last_scan_attempt = now
             self.simulate()
 
-        # self.simulate()
-        self.process_incoming()
+    def loop(self):
+        profiler.step()
+        timeout = max(0.0, self.next_deadline() - time.monotonic())
+        if self.selector.select(timeout):
+            self.on_readable()
+
+        self.on_timers(time.monotonic())
+        metrics.tick()
+
+    def run(self):
+        # loop until connection breaks
+        while self.connection.connected:
+            self.loop()
 
     def simulate(self):
-        if len(self.players) <= 1:
+        if self.field.player_count <= 1:
             return
         if not self.simulation.initialized:
             return
 
-        self.angle, self.power = self.simulation.find_solution()
+        if self.background_solver is not None:
+            solution = self.background_solver.best()
+            if solution is None:
+                return
+            self.angle, self.power = solution
+            self.simulation.angle, self.simulation.power = solution
+            trace = self.background_solver.last_trace()
+            if trace is not None:
+                self.simulation.lastTrace = trace
+        else:
+            self.angle, self.power = self.simulation.find_solution()
         self.shoot()
+        start = metrics.now()
         self.simulation.draw()
-        self.last_scan = datetime.now()
+        metrics.observe("draw", start)
+        self.last_scan = time.monotonic()
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import utils
+from SimulationHandler import SimulationHandler
+
+# seeded scenarios for the simulation and solver hot paths, results go to stdout and optionally json
+
+SCENARIOS = [
+    # name, seed, players, shot kind
+    ("near-miss-6", 1, 6, "near_miss"),
+    ("near-miss-12", 2, 12, "near_miss"),
+    ("long-orbit-12", 3, 12, "long_orbit"),
+]
+
+
+# parity checks, the batch engine and the cell index against the scalar path, early exit against full runs.
+# crowded puts an opponent on either side of our own player, one before and one after it in field order
+CHECKS = [
+    # name, seed, players, own id, crowded
+    ("parity-6", 1, 6, 0, False),
+    ("parity-12", 2, 12, 5, False),
+    ("crowded-6", 4, 6, 2, True),
+]
+
+
+def build_scenario(seed, players, own_id=0, crowded=False):
+    rng = random.Random(seed)
+    simulation = SimulationHandler(headless=True, verbose=False)
+    planets = utils.random_planets(rng, simulation.numPlanets, simulation.battlefieldW, simulation.battlefieldH)
+    field = []
+    for player_id in range(players):
+        x, y = utils.free_position(rng, planets, simulation.battlefieldW, simulation.battlefieldH)
+        field.append(utils.Player(x, y, player_id))
+    if crowded:
+        # closer than playerSize + 1.0 plus playerSize, shots cross them before they leave the source
+        x, y = field[own_id].position
+        field[own_id - 1] = utils.Player(x + 5.0, y, own_id - 1)
+        field[own_id + 1] = utils.Player(x, y - 5.0, own_id + 1)
+    simulation.set_field(planets, field, own_id)
+    return simulation, field
+
+
+def pick_shots(simulation, field, kind, count):
+    # sweep once and keep the shots of the requested kind, closest first
+    angles, energies = np.meshgrid(np.arange(0, 360, 1.0), np.linspace(simulation.minEnergy, simulation.maxEnergy, 5),
+                                   indexing="ij")
+    angles = angles.ravel()
+    energies = energies.ravel()
+
+    if kind == "long_orbit":
+        codes, _, _, _, _ = simulation.simulate_batch(angles, energies, trace=False)
+        picked = np.flatnonzero(codes == utils.MissileResult.RES_OUT_OF_SEGMENTS.value)
+    else:
+        target = field[1]
+        codes, infos, _, _, closest = simulation.simulate_batch(angles, energies, trace=False,
+                                                                target=target.position)
+        near = (closest > simulation.playerSize) & (codes != utils.MissileResult.RES_HIT_PLAYER.value)
+        picked = np.flatnonzero(near)
+        picked = picked[np.argsort(closest[picked], kind="stable")]
+
+    picked = picked[:count]
+    return angles[picked], energies[picked]
+
+
+def measure(function, repeat=1, memory=True):
+    # best wall time of repeat runs, peak memory from one extra traced run since tracing skews timing
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def run_scenario(name, seed, players, kind, shots, repeat, memory):
+    simulation, field = build_scenario(seed, players)
+    angles, energies = pick_shots(simulation, field, kind, shots)
+    target = field[1].position
+    results = {"scenario": name, "seed": seed, "players": players, "kind": kind, "shots": int(len(angles))}
+
+    def scalar():
+        return sum(len(simulation.simulate_own_shot(a, e)[2]) for a, e in zip(angles, energies))
+
+    def distance():
+        return [simulation.calc_distance((a, e), target) for a, e in zip(angles, energies)]
+
+    def batch():
+        return int(simulation.simulate_batch(angles, energies, trace=False)[2].sum())
+
+    def scan():
+        return simulation.scan_angle((0, 360, 1.0), (energies[0] if len(energies) else 10.0,))
+
+    def solve():
+        # the search behind find_solution, without its cache so every repeat solves from scratch
+        return simulation.solver.solve(target, field[1].id)
+
+    elapsed, peak, segments = measure(scalar, repeat, memory)
+    results["simulate_own_shot"] = {"seconds": elapsed, "sims_per_s": len(angles) / elapsed,
+                                    "segments_per_s": segments / elapsed, "peak_bytes": peak}
+
+    elapsed, peak, _ = measure(distance, repeat, memory)
+    results["calc_distance"] = {"seconds": elapsed, "sims_per_s": len(angles) / elapsed, "peak_bytes": peak}
+
+    elapsed, peak, segments = measure(batch, repeat, memory)
+    results["simulate_batch"] = {"seconds": elapsed, "sims_per_s": len(angles) / elapsed,
+                                 "segments_per_s": segments / elapsed, "peak_bytes": peak}
+
+    elapsed, peak, _ = measure(scan, repeat, memory)
+    results["scan_angle"] = {"seconds": elapsed, "sims_per_s": 360 / elapsed, "peak_bytes": peak}
+
+    elapsed, peak, solution = measure(solve, repeat, memory)
+    results["find_solution"] = {"seconds": elapsed, "simulations": solution.simulations, "hit": solution.hit,
+                                "sims_per_s": solution.simulations / elapsed, "peak_bytes": peak}
+    return results
+
+
+def run_check(name, seed, players, own_id, crowded, shots):
+    # mismatch descriptions, empty when everything agrees
+    simulation, field = build_scenario(seed, players, own_id, crowded)
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 360, shots)
+    energies = rng.uniform(simulation.minEnergy, simulation.maxEnergy, shots)
+    if crowded:
+        # half of them straight past the close opponents
+        angles[:shots // 2] = rng.choice([90.0, 180.0], shots // 2) + rng.uniform(-30, 30, shots // 2)
+    failures = []
+
+    for early_exit in (False, True):
+        codes, infos, lengths, _, _ = simulation.simulate_batch(angles, energies, trace=False,
+                                                                early_exit=early_exit)
+        for k in range(shots):
+            result, info, length = simulation._simulate_own_shot(angles[k], energies[k], early_exit=early_exit)
+            if (result.value, info, length) != (codes[k], infos[k], lengths[k]):
+                failures.append(f"{name}: angle {angles[k]:.3f} energy {energies[k]:.3f} early_exit {early_exit}: "
+                                f"scalar {result.name} {info} {length}, "
+                                f"batch {utils.MissileResult(int(codes[k])).name} {infos[k]} {lengths[k]}")
+
+    # early exit may only cut shots that would not have hit anybody
+    grid_angles, grid_energies = np.meshgrid(np.arange(0, 360, 2.0),
+                                             np.linspace(simulation.minEnergy, simulation.maxEnergy, 6), indexing="ij")
+    grid_angles = grid_angles.ravel()
+    grid_energies = grid_energies.ravel()
+    codes, infos, _, _, _ = simulation.simulate_batch(grid_angles, grid_energies, trace=False)
+    early_codes, early_infos, _, _, _ = simulation.simulate_batch(grid_angles, grid_energies, trace=False,
+                                                                  early_exit=True)
+    hits = np.flatnonzero((codes == utils.MissileResult.RES_HIT_PLAYER.value) & (infos != own_id))
+    for k in hits[(early_codes[hits] != codes[hits]) | (early_infos[hits] != infos[hits])]:
+        failures.append(f"{name}: angle {grid_angles[k]} energy {grid_energies[k]}: early exit lost the hit on "
+                        f"player {infos[k]}, got {utils.MissileResult(int(early_codes[k])).name}")
+    return failures, len(hits)
+
+
+def check(shots):
+    # exits non-zero on any mismatch
+    failures = []
+    for name, seed, players, own_id, crowded in CHECKS:
+        start = time.perf_counter()
+        scenario_failures, hits = run_check(name, seed, players, own_id, crowded, shots)
+        failures += scenario_failures
+        print(f"{name}: {shots} shots scalar against batch, {hits} grid hits with early exit, "
+              f"{len(scenario_failures)} mismatches, {time.perf_counter() - start:.1f} s")
+    for failure in failures:
+        print(f"  {failure}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks for the simulation and solver hot paths")
+    parser.add_argument("--shots", type=int, default=20, help="shots per scenario for the per-shot paths")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--scenario", action="append", help="only run these scenarios")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced runs for peak memory")
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--check", action="store_true",
+                        help="run the seeded parity checks instead, --shots per scenario, non-zero exit on mismatch")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check(args.shots) else 1)
+
+    report = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+              "scenarios": []}
+    for name, seed, players, kind in SCENARIOS:
+        if args.scenario and name not in args.scenario:
+            continue
+        result = run_scenario(name, seed, players, kind, args.shots, args.repeat, not args.no_memory)
+        report["scenarios"].append(result)
+        print(f"{name}: {result['shots']} shots")
+        for path in ("simulate_own_shot", "calc_distance", "simulate_batch", "scan_angle", "find_solution"):
+            stats = result[path]
+            peak = "" if stats["peak_bytes"] is None else f"{stats['peak_bytes'] / 1e6:8.1f} MB peak"
+            print(f"  {path:18} {stats['seconds']:8.3f} s {stats['sims_per_s']:10.1f} sims/s {peak}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
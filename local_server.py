@@ -0,0 +1,241 @@
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+import utils
+from SimulationHandler import SimulationHandler
+
+# stand-in for the game server, speaks bot protocol version 9 and measures how fast bots react
+
+
+class Client:
+    def __init__(self, conn, address, player_id):
+        self.conn = conn
+        self.address = address
+        self.id = player_id
+        self.name = f"bot{player_id}"
+        self.velocity = 10.0
+        self.send_lock = threading.Lock()
+        # monotonic time of the last layout/respawn we still wait for a shot on
+        self.pending_since = None
+
+    def send(self, data):
+        with self.send_lock:
+            try:
+                self.conn.sendall(data)
+            except OSError:
+                pass
+
+
+class LocalServer:
+    def __init__(self, port, planets, players, shot_rate, layout_interval, seed):
+        self.port = port
+        self.num_planets = planets
+        self.num_opponents = players
+        self.shot_rate = shot_rate
+        self.layout_interval = layout_interval
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.simulation = SimulationHandler(headless=True, verbose=False)
+        self.clients = {}
+        self.positions = {}
+        self.planets = []
+        self.next_id = 0
+        self.latencies = []
+        self.shots = 0
+        self.running = True
+
+        self.opponents = [self.new_id() for _ in range(players)]
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    # layout
+
+    def generate_planets(self):
+        self.planets = utils.random_planets(self.random, self.num_planets,
+                                            self.simulation.battlefieldW, self.simulation.battlefieldH)
+
+    def free_position(self):
+        return utils.free_position(self.random, self.planets,
+                                   self.simulation.battlefieldW, self.simulation.battlefieldH)
+
+    # messages
+
+    def msg_planets(self):
+        body = b"".join(struct.pack("dddd", *p.position, p.radius, p.mass) for p in self.planets)
+        return struct.pack("II", 9, len(self.planets)) + struct.pack("I", len(body)) + body
+
+    def msg_player(self, player_id):
+        return struct.pack("II", 3, player_id) + struct.pack("ff", *self.positions[player_id])
+
+    def broadcast(self, data, respawned=None):
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            if respawned is not None and client.pending_since is None:
+                client.pending_since = now
+            client.send(data)
+
+    def new_layout(self):
+        with self.lock:
+            self.generate_planets()
+            for player_id in list(self.positions):
+                self.positions[player_id] = self.free_position()
+            data = self.msg_planets() + b"".join(self.msg_player(p) for p in self.positions)
+            self.broadcast(data, respawned=True)
+
+    # shots
+
+    def fire(self, shooter, angle, velocity):
+        with self.lock:
+            if shooter not in self.positions:
+                return
+            players = [utils.Player(x, y, player_id) for player_id, (x, y) in self.positions.items()]
+            self.simulation.set_field(self.planets, players, shooter)
+            # the wire angle is what the bot feeds into utils.Missile as -angle + 90
+            result, info, trace = self.simulation.simulate_own_shot(90 - angle, velocity, dtype=np.float32)
+            self.shots += 1
+
+            data = struct.pack("II", 5, shooter) + struct.pack("dd", angle, velocity)
+            data += struct.pack("II", 6, shooter) + struct.pack("ddI", angle, velocity, len(trace)) + trace.tobytes()
+
+            respawned = None
+            if result == utils.MissileResult.RES_HIT_PLAYER:
+                self.positions[info] = self.free_position()
+                data += self.msg_player(info)
+                respawned = True
+            self.broadcast(data, respawned)
+
+    def opponent_loop(self):
+        while self.running:
+            if not self.opponents or self.shot_rate <= 0:
+                time.sleep(0.5)
+                continue
+            time.sleep(self.random.expovariate(self.shot_rate * len(self.opponents)))
+            self.fire(self.random.choice(self.opponents), self.random.uniform(0, 360),
+                      self.random.uniform(5, 15))
+
+    def layout_loop(self):
+        while self.running:
+            time.sleep(self.layout_interval)
+            self.new_layout()
+
+    # clients
+
+    def handle(self, conn, address):
+        lines = conn.makefile("r", encoding="UTF-8")
+        client = None
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            if line.startswith("b "):
+                if int(line[2:]) != 9:
+                    print(f"{address}: unsupported bot protocol version {line[2:]}")
+                    break
+                with self.lock:
+                    client = Client(conn, address, self.new_id())
+                    self.positions[client.id] = self.free_position()
+                    client.pending_since = time.monotonic()
+                    client.send(struct.pack("II", 1, client.id) + self.msg_planets() +
+                                b"".join(self.msg_player(p) for p in self.positions))
+                    self.clients[client.id] = client
+                    self.broadcast(self.msg_player(client.id))
+                print(f"{address} joined as player {client.id}")
+
+            elif client is None:
+                continue
+
+            elif line.startswith("n "):
+                client.name = line[2:]
+
+            elif line.startswith("v "):
+                client.velocity = float(line[2:])
+
+            elif line == "u":
+                client.send(struct.pack("II", 8, 0) + struct.pack("d", 1000.0))
+
+            else:
+                try:
+                    angle = float(line)
+                except ValueError:
+                    print(f"{client.name}: unknown command '{line}'")
+                    continue
+                if client.pending_since is not None:
+                    latency = time.monotonic() - client.pending_since
+                    client.pending_since = None
+                    with self.lock:
+                        self.latencies.append(latency)
+                    print(f"{client.name}: shot {round(latency * 1000, 1)} ms after layout/respawn")
+                self.fire(client.id, angle, client.velocity)
+
+        if client is not None:
+            with self.lock:
+                del self.clients[client.id]
+                del self.positions[client.id]
+                self.broadcast(struct.pack("II", 2, client.id))
+            print(f"{client.name} left")
+        conn.close()
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            shots = self.shots
+        if not len(latencies):
+            return f"{shots} shots, no reaction measured yet"
+        return (f"{shots} shots, {len(latencies)} reactions: mean {latencies.mean() * 1000:.1f} ms, "
+                f"p50 {np.percentile(latencies, 50) * 1000:.1f} ms, p95 {np.percentile(latencies, 95) * 1000:.1f} ms, "
+                f"max {latencies.max() * 1000:.1f} ms")
+
+    def serve(self):
+        self.generate_planets()
+        for player_id in self.opponents:
+            self.positions[player_id] = self.free_position()
+
+        threading.Thread(target=self.opponent_loop, daemon=True).start()
+        if self.layout_interval > 0:
+            threading.Thread(target=self.layout_loop, daemon=True).start()
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", self.port))
+        server.listen()
+        server.settimeout(10)
+        print(f"listening on 127.0.0.1:{self.port}")
+
+        try:
+            while True:
+                try:
+                    conn, address = server.accept()
+                except socket.timeout:
+                    print(self.summary())
+                    continue
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=self.handle, args=(conn, address), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.running = False
+            server.close()
+            print(self.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stand-in game server for bot protocol version 9")
+    parser.add_argument("--port", type=int, default=3490)
+    parser.add_argument("--planets", type=int, default=24)
+    parser.add_argument("--players", type=int, default=11, help="simulated opponents besides connected bots")
+    parser.add_argument("--shot-rate", type=float, default=0.2, help="shots per second per simulated opponent")
+    parser.add_argument("--layout-interval", type=float, default=30, help="seconds between new planet layouts, 0 keeps one")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    LocalServer(args.port, args.planets, args.players, args.shot_rate, args.layout_interval, args.seed).serve()
@@ -1,4 +1,9 @@
+import signal
+
 from SocketManager import SocketManager
+from Metrics import metrics
+from Profiler import profiler
+from SessionCapture import SessionCapture
 import appleBot
 
 # CONFIG
@@ -6,17 +11,43 @@ IP = "127.0.0.1"
 PORT = 3490
 BOT_VERSION = 9
 RECV_TIMEOUT = 0.1
+SEARCH_WORKERS = 0  # worker processes for shot search, 0 searches in-process
+SOLUTION_CACHE_PATH = None  # file to keep solved shots across restarts, None keeps them in memory only
+BACKGROUND_SOLVER = True  # search in a background thread, the loop fires the best solution so far
+KEEP_OPPONENT_TRACES = False  # keep the last shot trace of every player instead of skipping it
+HEADLESS = False  # no window and no pygame, for servers without a display
+VISUALIZER_FPS = 30  # frame cap of the visualizer thread, 0 draws inline after every shot
+METRICS = False  # per-phase latency histograms and counters, off costs one check per call site
+METRICS_INTERVAL = 60  # seconds between printed summaries
+METRICS_PATH = None  # file that gets the prometheus text with every summary
+METRICS_PORT = None  # serve the prometheus text on 127.0.0.1:<port>/metrics
+PROFILE_SIGNAL = True  # SIGUSR1 profiles the running bot for PROFILE_SECONDS, where the platform has it
+PROFILE_PORT = None  # GET 127.0.0.1:<port>/profile?seconds=<n> starts a profile too
+PROFILE_SECONDS = 10
+PROFILE_DIR = "."  # gets profile-<time>.collapsed and one profile-<time>-<thread>.pstats per profiled thread
+CAPTURE_PATH = None  # file that records the raw session for replay.py, None records nothing
 
 if __name__ == "__main__":
 
-    # initialize connection and wait for it to establish
-    sock_manager = SocketManager(IP, PORT, BOT_VERSION, RECV_TIMEOUT)
-    while not sock_manager.connected:
-        pass
+    if METRICS:
+        metrics.configure(True, METRICS_INTERVAL, METRICS_PATH, METRICS_PORT)
+
+    profiler.configure(PROFILE_SECONDS, directory=PROFILE_DIR, port=PROFILE_PORT,
+                       signum=getattr(signal, "SIGUSR1", None) if PROFILE_SIGNAL else None)
+
+    capture = SessionCapture(CAPTURE_PATH) if CAPTURE_PATH else None
+
+    # initialize connection, returns once it is established
+    sock_manager = SocketManager(IP, PORT, BOT_VERSION, RECV_TIMEOUT, capture)
 
     # initialize bot object
-    bot = appleBot.AppleBot(sock_manager)
+    bot = appleBot.AppleBot(sock_manager, SEARCH_WORKERS, SOLUTION_CACHE_PATH, BACKGROUND_SOLVER,
+                            KEEP_OPPONENT_TRACES, HEADLESS, VISUALIZER_FPS)
 
-    # loop until connection breaks
-    while sock_manager.connected:
-        bot.loop()
+    # event loop until connection breaks
+    try:
+        bot.run()
+    finally:
+        bot.close()
+        if capture is not None:
+            capture.close()
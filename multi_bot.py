@@ -0,0 +1,82 @@
+import argparse
+import multiprocessing
+import selectors
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import appleBot
+from LayoutCache import LayoutCache
+from Metrics import metrics
+from Profiler import profiler
+from SocketManager import SocketManager
+from main import IP, PORT, BOT_VERSION, RECV_TIMEOUT, BACKGROUND_SOLVER, KEEP_OPPONENT_TRACES, PROFILE_SIGNAL, \
+    PROFILE_SECONDS, PROFILE_DIR
+
+# runs many headless bots from one process on one selector, bots share planet-layout data through a LayoutCache
+
+
+def connect(count, ip, port):
+    # connecting waits out the server greeting per socket, do them side by side
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(lambda _: SocketManager(ip, port, BOT_VERSION, RECV_TIMEOUT), range(count)))
+
+
+def run_bots(count, ip, port, name, first, background_solver):
+    # every process profiles itself on SIGUSR1, see main.PROFILE_SIGNAL
+    if PROFILE_SIGNAL and hasattr(signal, "SIGUSR1"):
+        profiler.configure(PROFILE_SECONDS, directory=PROFILE_DIR, signum=signal.SIGUSR1)
+    layout_cache = LayoutCache()
+    selector = selectors.DefaultSelector()
+    bots = []
+    for k, sock_manager in enumerate(connect(count, ip, port)):
+        bots.append(appleBot.AppleBot(sock_manager, background_solver=background_solver,
+                                      keep_opponent_traces=KEEP_OPPONENT_TRACES, headless=True,
+                                      name=f"{name}{first + k}", layout_cache=layout_cache, selector=selector))
+
+    while bots:
+        timeout = max(0.0, min(bot.next_deadline() for bot in bots) - time.monotonic())
+        for key, _ in selector.select(timeout):
+            key.data.on_readable()
+
+        now = time.monotonic()
+        for bot in bots:
+            if bot.connection.connected:
+                bot.on_timers(now)
+
+        profiler.step()
+        for bot in [bot for bot in bots if not bot.connection.connected]:
+            selector.unregister(bot.connection)
+            bot.close()
+            bots.remove(bot)
+            print(f"{bot.name} disconnected, {len(bots)} bots left")
+        metrics.tick()
+
+    print(f"layout cache: {layout_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run several bots from one or a few processes")
+    parser.add_argument("--bots", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=1, help="bots are split evenly across these processes")
+    parser.add_argument("--ip", default=IP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--name", default="AppleBot", help="bots are named <name><number>")
+    parser.add_argument("--background-solver", action="store_true", default=BACKGROUND_SOLVER)
+    parser.add_argument("--no-background-solver", dest="background_solver", action="store_false")
+    args = parser.parse_args()
+
+    processes = max(1, min(args.processes, args.bots))
+    shares = [args.bots // processes + (k < args.bots % processes) for k in range(processes)]
+    firsts = [sum(shares[:k]) for k in range(processes)]
+
+    if processes == 1:
+        run_bots(args.bots, args.ip, args.port, args.name, 0, args.background_solver)
+    else:
+        workers = [multiprocessing.Process(target=run_bots,
+                                           args=(share, args.ip, args.port, args.name, first, args.background_solver))
+                   for share, first in zip(shares, firsts)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
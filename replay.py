@@ -0,0 +1,134 @@
+import argparse
+import select
+import socket
+import threading
+import time
+
+import appleBot
+from Metrics import metrics
+from SessionCapture import read_capture, INBOUND, OUTBOUND
+from SocketManager import SocketManager
+from main import BOT_VERSION, RECV_TIMEOUT, KEEP_OPPONENT_TRACES
+
+# feeds a capture written with main.CAPTURE_PATH back into an AppleBot over a local socket pair and reports what
+# the bot sent and how long its phases took. At a recorded pace the bot runs its own loop and timers, --fast hands it
+# one recorded read after the other on this thread and can have it decide on a shot after every field change
+
+
+def feed(sock, records, speed):
+    # inbound bytes at their recorded time divided by speed
+    start = time.monotonic()
+    for seconds, data in records:
+        delay = start + seconds / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            sock.sendall(data)
+        except OSError:
+            return
+    # the bot reads the end of the capture as a dropped connection and returns from run()
+    sock.shutdown(socket.SHUT_WR)
+
+
+def drain(sock, commands):
+    # everything the bot sends, as (monotonic time, line), the socket turns non-blocking under feed_fast
+    pending = b""
+    while True:
+        try:
+            select.select([sock], [], [])
+            data = sock.recv(1 << 16)
+        except BlockingIOError:
+            continue
+        except (OSError, ValueError):
+            return
+        if not data:
+            return
+        now = time.monotonic()
+        *lines, pending = (pending + data).split(b"\n")
+        commands.extend((now, line.decode("UTF-8", "replace")) for line in lines)
+
+
+def feed_fast(sock, records, bot, decide):
+    # the bot reads each record before the next one goes out, a decision is timed from the read that caused it
+    sock.setblocking(False)
+    field = bot.simulation.field
+    for _, data in records:
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[sock.send(view):]
+            except BlockingIOError:
+                pass
+            bot.on_readable()
+        if decide and bot.simulation.field is not field:
+            field = bot.simulation.field
+            start = metrics.now()
+            bot.simulate()
+            metrics.observe("decide", start)
+    sock.shutdown(socket.SHUT_WR)
+    while bot.connection.connected:
+        bot.on_readable()
+
+
+def command_counts(lines):
+    counts = {}
+    for line in lines:
+        # "v 12" and the bare angle that follows it are both shot commands
+        kind = line.split(" ", 1)[0] if line[:1].isalpha() else "angle"
+        counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+def replay(path, speed, background_solver, headless, decide):
+    inbound = []
+    recorded = []
+    for direction, seconds, data in read_capture(path):
+        if direction == INBOUND:
+            inbound.append((seconds, data))
+        elif direction == OUTBOUND:
+            recorded.extend(data.decode("UTF-8", "replace").splitlines())
+    duration = inbound[-1][0] if inbound else 0.0
+    print(f"replaying {sum(len(data) for _, data in inbound)} bytes in {len(inbound)} reads, "
+          f"recorded over {duration:.1f} s, speed {speed or 'max'}")
+
+    server_end, bot_end = socket.socketpair()
+    commands = []
+    drainer = threading.Thread(target=drain, args=(server_end, commands), name="Drain", daemon=True)
+    metrics.configure(True, 0)
+
+    start = time.monotonic()
+    connection = SocketManager(None, None, BOT_VERSION, RECV_TIMEOUT, sock=bot_end)
+    # fast decisions are made inline, a background solver would only hand out whatever it had so far
+    bot = appleBot.AppleBot(connection, background_solver=background_solver and bool(speed),
+                            keep_opponent_traces=KEEP_OPPONENT_TRACES, headless=headless)
+    drainer.start()
+    if speed:
+        threading.Thread(target=feed, args=(server_end, inbound, speed), name="Feed", daemon=True).start()
+        bot.run()
+    else:
+        feed_fast(server_end, inbound, bot, decide)
+    elapsed = time.monotonic() - start
+
+    bot.close()
+    connection.close()
+    drainer.join()
+    server_end.close()
+
+    print(f"replayed in {elapsed:.2f} s ({duration / elapsed if elapsed else 0:.1f}x recorded pace)")
+    print(f"commands recorded {command_counts(recorded)}")
+    print(f"commands replayed {command_counts([line for _, line in commands])}")
+    print(metrics.summary(elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="feed a captured server session into the bot")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded pace, 0 is --fast")
+    parser.add_argument("--fast", dest="speed", action="store_const", const=0.0,
+                        help="one read after the other, as fast as the bot takes them")
+    parser.add_argument("--decide", action="store_true", help="with --fast, pick a shot after every field change")
+    parser.add_argument("--background-solver", action="store_true", help="only used at a recorded pace")
+    parser.add_argument("--window", action="store_true", help="show the visualizer, headless by default")
+    args = parser.parse_args()
+
+    replay(args.capture, args.speed, args.background_solver, not args.window, args.decide)
@@ -0,0 +1,72 @@
+import argparse
+import subprocess
+import sys
+import time
+
+# import and init cost of the bot, every module is measured in a fresh interpreter so shared imports don't hide
+
+MODULES = ["numpy", "utils", "GravityField", "SpatialIndex", "ShotSolver", "ShotAtlas", "SolutionCache",
+           "ParallelSearch", "SimulationHandler", "BackgroundSolver", "SocketManager", "appleBot", "Visualizer"]
+HEAVY = ["pygame", "scipy", "tqdm", "http.server", "cProfile"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+INIT = """
+import sys, time
+start = time.perf_counter()
+from SimulationHandler import SimulationHandler
+imported = time.perf_counter()
+simulation = SimulationHandler(headless={headless}, verbose=False, visualizer_fps=0)
+initialized = time.perf_counter()
+print(imported - start, initialized - imported, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+
+def run(code):
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    # the last line, pygame prints a banner on import
+    return output.strip().splitlines()[-1].split()
+
+
+def probe_imports(modules, repeat):
+    rows = []
+    for module in modules:
+        try:
+            runs = [run(PROBE.format(module=module, heavy=HEAVY)) for _ in range(repeat)]
+        except subprocess.CalledProcessError:
+            rows.append((module, None, ["not importable"]))
+            continue
+        rows.append((module, min(float(r[0]) for r in runs), runs[0][1:]))
+    return rows
+
+
+def probe_init(headless, repeat):
+    runs = [run(INIT.format(headless=headless, heavy=HEAVY)) for _ in range(repeat)]
+    return min(float(r[0]) for r in runs), min(float(r[1]) for r in runs), runs[0][2:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="import and init cost of the bot modules")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement, best is shown")
+    parser.add_argument("--module", action="append", help="only measure these modules")
+    parser.add_argument("--window", action="store_true", help="also measure SimulationHandler with a window")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print("import, fresh interpreter each")
+    for module, elapsed, heavy in probe_imports(args.module or MODULES, args.repeat):
+        cost = "" if elapsed is None else f"{elapsed * 1000:8.1f} ms"
+        print(f"  {module:18} {cost:>11}  {' '.join(heavy)}")
+
+    print("SimulationHandler")
+    for headless in [True, False] if args.window else [True]:
+        imported, initialized, heavy = probe_init(headless, args.repeat)
+        mode = "headless" if headless else "window"
+        print(f"  {mode:18} import {imported * 1000:8.1f} ms  init {initialized * 1000:8.1f} ms  {' '.join(heavy)}")
+    print(f"report took {time.perf_counter() - start:.1f} s")
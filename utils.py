@@ -38,13 +38,45 @@ class Missile:
         self.left_source = False
 
 
+class Solution:
+    def __init__(self, angle, energy, distance, hit, simulations, exact=True):
+        self.angle = angle
+        self.energy = energy
+        self.distance = distance
+        self.hit = hit
+        self.simulations = simulations
+        # False for a screened candidate, its distance comes from the field table or adaptive steps
+        self.exact = exact
+
+
 class MissileResult(Enum):
     RES_UNDETERMINED = -1
     RES_HIT_PLANET = 0
     RES_HIT_PLAYER = 1
     RES_OUT_OF_BOUNDS = 2
     RES_OUT_OF_SEGMENTS = 3
-
+    # early exits, see SimulationHandler.earlyExit
+    RES_ESCAPED = 4
+    RES_UNREACHABLE = 5
+
+
+def random_planets(rng, count, width, height):
+    # non-overlapping planets, used by the local server and the benchmarks
+    planets = []
+    while len(planets) < count:
+        radius = rng.uniform(15, 60)
+        x = rng.uniform(radius, width - radius)
+        y = rng.uniform(radius, height - radius)
+        if all(math.hypot(x - p.position[0], y - p.position[1]) > radius + p.radius + 30 for p in planets):
+            planets.append(Planet(x, y, radius, radius ** 3 * 0.02, len(planets)))
+    return planets
+
+def free_position(rng, planets, width, height):
+    while True:
+        x = rng.uniform(20, width - 20)
+        y = rng.uniform(20, height - 20)
+        if all(math.hypot(x - p.position[0], y - p.position[1]) > p.radius + 10 for p in planets):
+            return x, y
 
 def hsv2rgb(h,s,v):
     return tuple(round(i * 255) for i in colorsys.hsv_to_rgb(h,s,v))